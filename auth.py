@@ -0,0 +1,152 @@
+import hmac
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+from fastapi import Depends, Header, HTTPException, Security
+from fastapi.security import HTTPBearer
+from jose import JWTError, jwt
+from sqlalchemy.orm import Session
+
+from database import get_db
+from models import User
+from schemas import CurrentUser
+
+SECRET_KEY = "mysecretkey"  # change to something secure
+ALGORITHM = "HS256"
+ACCESS_TOKEN_EXPIRE_MINUTES = 60
+
+# Verified tokens are kept in memory so hot requests skip the signature check
+# and the users lookup. Entries never outlive the token's own "exp".
+TOKEN_CACHE_MAX_ENTRIES = int(os.getenv("TOKEN_CACHE_MAX_ENTRIES", "10000"))
+TOKEN_CACHE_TTL_SECONDS = int(os.getenv("TOKEN_CACHE_TTL_SECONDS", "300"))
+
+security = HTTPBearer(auto_error=False)
+
+# 🔒 Shared secret for internal dashboards (cohort analytics); those
+# endpoints are disabled while it isn't set
+INTERNAL_API_KEY = os.getenv("INTERNAL_API_KEY")
+
+
+class TokenCache:
+    def __init__(self, max_entries: int, ttl_seconds: int):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()  # token -> (expires_at, CurrentUser)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, token: str):
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(token)
+            if entry is None:
+                self.misses += 1
+                return None
+            expires_at, user = entry
+            if expires_at <= now:
+                del self._entries[token]
+                self.evictions += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(token)
+            self.hits += 1
+            return user
+
+    def put(self, token: str, user: CurrentUser, token_exp: float | None):
+        expires_at = time.time() + self.ttl_seconds
+        if token_exp is not None:
+            expires_at = min(expires_at, token_exp)
+        with self._lock:
+            self._entries[token] = (expires_at, user)
+            self._entries.move_to_end(token)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            size = len(self._entries)
+        lookups = self.hits + self.misses
+        return {
+            "size": size,
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl_seconds,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+token_cache = TokenCache(TOKEN_CACHE_MAX_ENTRIES, TOKEN_CACHE_TTL_SECONDS)
+
+
+def create_access_token(user: User):
+    # user_id + onboarding state ride along in the claims so requests
+    # don't need a users lookup. Onboarding fields reflect login time.
+    token_data = {
+        "sub": user.email,
+        "uid": user.id,
+        "onboarding_completed": bool(user.onboarding_completed),
+        "onboarding_step": user.onboarding_step,
+        "exp": datetime.utcnow() + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
+    }
+    return jwt.encode(token_data, SECRET_KEY, algorithm=ALGORITHM)
+
+
+def get_current_user(
+    credentials: dict = Security(security),
+    db: Session = Depends(get_db)
+) -> CurrentUser:
+    if not credentials:
+        raise HTTPException(status_code=401, detail="Missing token")
+
+    token = credentials.credentials
+    cached = token_cache.get(token)
+    if cached is not None:
+        return cached
+
+    try:
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+    except JWTError:
+        raise HTTPException(status_code=401, detail="Invalid token")
+
+    email = payload.get("sub")
+    if payload.get("uid") is not None:
+        # ✅ Fast path: everything we need is in the claims
+        current = CurrentUser(
+            id=payload["uid"],
+            email=email,
+            onboarding_completed=payload.get("onboarding_completed") or False,
+            onboarding_step=payload.get("onboarding_step") or 1,
+        )
+    else:
+        # Tokens issued before uid was added to the claims
+        user = db.query(User).filter(User.email == email).first()
+        if not user:
+            raise HTTPException(status_code=404, detail="User not found")
+        current = CurrentUser(
+            id=user.id,
+            email=user.email,
+            onboarding_completed=bool(user.onboarding_completed),
+            onboarding_step=user.onboarding_step or 1,
+        )
+
+    token_cache.put(token, current, payload.get("exp"))
+    return current
+
+
+def require_internal_key(x_internal_key: str | None = Header(default=None)):
+    if not INTERNAL_API_KEY:
+        raise HTTPException(status_code=403, detail="Internal API disabled")
+    if not x_internal_key or not hmac.compare_digest(x_internal_key, INTERNAL_API_KEY):
+        raise HTTPException(status_code=403, detail="Invalid internal key")
@@ -0,0 +1,87 @@
+# Documents per second for biomarker matching: the old per-call pattern dict
+# with whitespace normalization + one re.search per marker, vs the compiled
+# single-pass matcher in biomarkers.py.
+#
+#   python benchmarks/bench_biomarkers.py --pages 12 --docs 2000
+import argparse
+import os
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from biomarkers import match_biomarkers  # noqa: E402
+
+FILLER = (
+    "Patient Name: John Doe    Date: 06-Nov-2025    Lab ID: #MC-2025-4412\n"
+    "TEST NAME            RESULT     UNITS      REF. RANGE\n"
+    "Hemoglobin           14.2       g/dL       13.5 - 17.5\n"
+    "White Blood Cells    6.1        10^3/uL    4.5 - 11.0\n"
+    "Platelets            250        10^3/uL    150 - 400\n"
+) * 8
+
+PANEL = (
+    "LDL-C calculé   135.4 mg/dL\n"
+    "HDL-C   47.2 mg/dL\n"
+    "Triglycérides   108.6 mg/dL\n"
+    "Fasting Glucose   92.5 mg/dL\n"
+    "Créatinine   0.89 mg/dL\n"
+)
+
+
+def old_match(text: str):
+    # extract_lab_values before the registry
+    text = re.sub(r"\s+", " ", text)
+    patterns = {
+        "LDL": r"LDL[−\-]?C\s*(?:calculé)?\s*([\d.]+)",
+        "HDL": r"HDL[−\-]?C\s*([\d.]+)",
+        "Triglycerides": r"Triglyc[ée]rides\s*([\d.]+)",
+        "Glucose": r"(?:Glucose|Fasting Glucose)\s*([\d.]+)",
+        "Creatinine": r"Cr[ée]atinine\s*([\d.]+)"
+    }
+    extracted = {}
+    for key, pattern in patterns.items():
+        match = re.search(pattern, text, re.IGNORECASE)
+        if match:
+            val = match.group(1)
+            if re.match(r"^\d+(\.\d+)?$", val):
+                extracted[key] = float(val)
+            else:
+                extracted[key] = val.capitalize()
+        else:
+            extracted[key] = None
+    return extracted
+
+
+def make_document(pages: int):
+    # lipid/glucose panel on page 2, like most real reports
+    return "".join(FILLER + (PANEL if page == 1 else "") + "\f" for page in range(pages))
+
+
+def docs_per_second(fn, doc: str, n: int):
+    start = time.perf_counter()
+    for _ in range(n):
+        fn(doc)
+    return n / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--pages", type=int, default=12)
+    parser.add_argument("--docs", type=int, default=2000)
+    args = parser.parse_args()
+
+    doc = make_document(args.pages)
+    assert old_match(doc) == match_biomarkers(doc), "matchers disagree"
+
+    old = docs_per_second(old_match, doc, args.docs)
+    new = docs_per_second(match_biomarkers, doc, args.docs)
+    print(f"document: {args.pages} pages, {len(doc) / 1024:.1f} KiB")
+    print(f"old (normalize + 5 searches): {old:10.1f} docs/s")
+    print(f"registry (single pass):       {new:10.1f} docs/s")
+    print(f"speedup: {new / old:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,48 @@
+# Rows per second for lab classification: the scalar classify_lab_results
+# loop vs lab_analytics.classify_values over NumPy columns.
+#
+#   python benchmarks/bench_lab_analytics.py --rows 1000000
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from biomarkers import BIOMARKERS  # noqa: E402
+from lab_analytics import classify_values, status_labels  # noqa: E402
+from lab_processing import classify_lab_results  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    columns = {m.key: rng.uniform(0.3, 250, args.rows) for m in BIOMARKERS}
+    rows = [dict(zip(columns, values)) for values in zip(*(c.tolist() for c in columns.values()))]
+
+    start = time.perf_counter()
+    scalar = [classify_lab_results(row) for row in rows]
+    scalar_s = time.perf_counter() - start
+
+    start = time.perf_counter()
+    codes = {m.key: classify_values(m, columns[m.key]) for m in BIOMARKERS}
+    vector_s = time.perf_counter() - start
+
+    # same answers
+    for i in range(0, args.rows, max(1, args.rows // 1000)):
+        for m in BIOMARKERS:
+            assert scalar[i][f"{m.key}_status"] == status_labels(m)[codes[m.key][i]]
+
+    print(f"rows: {args.rows}, markers: {len(BIOMARKERS)}")
+    print(f"scalar classify_lab_results: {args.rows / scalar_s:14.0f} rows/s")
+    print(f"numpy classify_values:       {args.rows / vector_s:14.0f} rows/s")
+    print(f"speedup: {scalar_s / vector_s:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
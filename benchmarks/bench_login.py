@@ -0,0 +1,54 @@
+# Logins per second per core through the hashing pool.
+#
+#   python benchmarks/bench_login.py --logins 200 --concurrency 64
+#
+# Each "login" is one bcrypt verify, which dominates /login latency.
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import hashing  # noqa: E402
+
+
+async def run(logins: int, concurrency: int):
+    hashed = hashing.pwd_context.hash("correct horse battery staple")
+    sem = asyncio.Semaphore(concurrency)
+
+    async def one_login():
+        async with sem:
+            assert await hashing.verify_password_async("correct horse battery staple", hashed)
+
+    # warm up the worker processes
+    await asyncio.gather(*(one_login() for _ in range(hashing.HASH_WORKERS)))
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one_login() for _ in range(logins)))
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--logins", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=64)
+    args = parser.parse_args()
+
+    # the benchmark drives the pool on purpose; don't let admission control reject it
+    hashing.HASH_QUEUE_MAX = max(hashing.HASH_QUEUE_MAX, args.concurrency)
+
+    elapsed = asyncio.run(run(args.logins, args.concurrency))
+    hashing.shutdown()
+
+    per_sec = args.logins / elapsed
+    print(f"workers:            {hashing.HASH_WORKERS}")
+    print(f"logins:             {args.logins} in {elapsed:.2f}s")
+    print(f"logins/sec:         {per_sec:.1f}")
+    print(f"logins/sec/core:    {per_sec / hashing.HASH_WORKERS:.1f}")
+    print(f"latency p50/p95 ms: {hashing.stats()['latency_ms_p50']} / {hashing.stats()['latency_ms_p95']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+# Wall time and peak RSS of scanned-PDF OCR: the old all-pages-at-once serial
+# path vs lab_processing.ocr_pdf (lazy per-page rendering, parallel OCR).
+#
+#   python benchmarks/bench_ocr.py scanned_report.pdf --workers 4 --dpi 200
+#
+# Each mode runs in a fresh interpreter so peak RSS isn't shared between them.
+# Needs poppler (pdftoppm) and tesseract on PATH.
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+def run_mode(mode: str, pdf: str, workers: int, dpi: int):
+    import fitz
+    import pytesseract
+    from pdf2image import convert_from_path
+
+    import lab_processing
+
+    with fitz.open(pdf) as doc:
+        page_count = doc.page_count
+
+    start = time.perf_counter()
+    if mode == "serial":
+        # what extract_lab_values used to do
+        text = ""
+        for img in convert_from_path(pdf, dpi=dpi):
+            text += pytesseract.image_to_string(img)
+    else:
+        text = lab_processing.ocr_pdf(pdf, page_count, workers=workers, dpi=dpi)
+    elapsed = time.perf_counter() - start
+
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    rss_mb = rss / (1024 * 1024) if sys.platform == "darwin" else rss / 1024
+    print(json.dumps({"mode": mode, "pages": page_count, "seconds": elapsed,
+                      "peak_rss_mb": rss_mb, "chars": len(text)}))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("pdf")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--dpi", type=int, default=200)
+    parser.add_argument("--mode", choices=["serial", "parallel"])
+    args = parser.parse_args()
+
+    if args.mode:
+        run_mode(args.mode, args.pdf, args.workers, args.dpi)
+        return
+
+    results = []
+    for mode in ("serial", "parallel"):
+        out = subprocess.run(
+            [sys.executable, __file__, args.pdf, "--mode", mode,
+             "--workers", str(args.workers), "--dpi", str(args.dpi)],
+            check=True, capture_output=True, text=True,
+        ).stdout
+        results.append(json.loads(out.strip().splitlines()[-1]))
+
+    print(f"{'mode':<10}{'pages':>6}{'wall s':>10}{'peak RSS MB':>14}")
+    for r in results:
+        print(f"{r['mode']:<10}{r['pages']:>6}{r['seconds']:>10.2f}{r['peak_rss_mb']:>14.1f}")
+    serial, parallel = results
+    print(f"speedup: {serial['seconds'] / parallel['seconds']:.2f}x "
+          f"(workers={args.workers}, dpi={args.dpi})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+# Response size and build time for the saved recipes list: the old handler
+# (every SavedRecipe ORM object, ingredients/steps included, pushed through
+# FastAPI's jsonable_encoder) vs the summary projection now used by
+# GET /recipes/user/{user_id}. Both are measured for the same rows, so the
+# difference is the projection alone, not pagination.
+#
+#   python benchmarks/bench_recipe_list.py --recipes 300 --runs 20
+#
+# Measured locally (SQLite, 300 recipes with 12 ingredients / 6 steps each):
+#   before (ORM + jsonable_encoder)   363682 bytes   21.44 ms
+#   after (summary rows + json)        49883 bytes    6.79 ms
+# and a default page is 20 of those rows on top of that.
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.environ.setdefault("DATABASE_URL", "sqlite:///" + os.path.join(tempfile.mkdtemp(), "bench.sqlite3"))
+
+from fastapi.encoders import jsonable_encoder  # noqa: E402
+
+from response_cache import serialize  # noqa: E402
+from crud import get_saved_recipes_page, recipe_summary  # noqa: E402
+from database import Base, SessionLocal, engine  # noqa: E402
+from models import SavedRecipe, User  # noqa: E402
+
+INGREDIENTS = [
+    "2 boneless skinless chicken breasts, cut into 1-inch cubes",
+    "1 tablespoon extra virgin olive oil",
+    "3 cloves garlic, minced",
+    "1 medium red bell pepper, sliced",
+    "1 cup broccoli florets",
+    "2 tablespoons low-sodium soy sauce",
+    "1 teaspoon grated fresh ginger",
+    "1 cup cooked brown rice",
+    "Salt and freshly ground black pepper to taste",
+    "1 tablespoon toasted sesame seeds",
+    "2 green onions, thinly sliced",
+    "1 teaspoon honey",
+]
+STEPS = [
+    "Heat the olive oil in a large skillet or wok over medium-high heat until shimmering.",
+    "Season the chicken with salt and pepper, then cook for 5-6 minutes until golden on all sides.",
+    "Add the garlic and ginger and stir for 30 seconds until fragrant.",
+    "Toss in the bell pepper and broccoli and stir-fry for 3-4 minutes until crisp-tender.",
+    "Whisk the soy sauce with the honey, pour over the pan and toss to coat everything evenly.",
+    "Serve over warm brown rice, garnished with sesame seeds and sliced green onions.",
+]
+
+
+def seed(n: int):
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    db.add(User(full_name="Bench", email=f"bench{time.time()}@example.com", password="x"))
+    db.commit()
+    user_id = db.query(User.id).order_by(User.id.desc()).first()[0]
+    start = datetime(2025, 1, 1)
+    db.add_all([
+        SavedRecipe(
+            user_id=user_id, recipe_name=f"Garlic ginger chicken stir-fry #{i}",
+            ingredients=json.dumps(INGREDIENTS), steps=json.dumps(STEPS),
+            calories=520.5, protein=42.0, carbs=48.5, fat=14.2, servings=2,
+            created_at=start + timedelta(minutes=i),
+        )
+        for i in range(n)
+    ])
+    db.commit()
+    db.close()
+    return user_id
+
+
+def old_list(db, user_id):
+    recipes = (
+        db.query(SavedRecipe)
+        .filter(SavedRecipe.user_id == user_id)
+        .order_by(SavedRecipe.created_at.desc())
+        .all()
+    )
+    # what FastAPI does with a returned list of ORM objects
+    return json.dumps(jsonable_encoder(recipes)).encode()
+
+
+def new_list(db, user_id, n):
+    rows = get_saved_recipes_page(db, user_id, n)[:n]
+    return serialize([recipe_summary(row) for row in rows])
+
+
+def measure(fn, runs: int):
+    best = None
+    body = b""
+    for _ in range(runs):
+        db = SessionLocal()
+        start = time.perf_counter()
+        body = fn(db)
+        elapsed = time.perf_counter() - start
+        db.close()
+        best = elapsed if best is None else min(best, elapsed)
+    return body, best
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--recipes", type=int, default=300)
+    parser.add_argument("--runs", type=int, default=20)
+    args = parser.parse_args()
+
+    user_id = seed(args.recipes)
+    old_body, old_s = measure(lambda db: old_list(db, user_id), args.runs)
+    new_body, new_s = measure(lambda db: new_list(db, user_id, args.recipes), args.runs)
+    assert len(json.loads(old_body)) == len(json.loads(new_body)) == args.recipes
+
+    print(f"{args.recipes} recipes, best of {args.runs} (query + serialization)")
+    print(f"{'':<34}{'bytes':>10}{'ms':>10}")
+    print(f"{'before (ORM + jsonable_encoder)':<34}{len(old_body):>10}{old_s * 1000:>10.2f}")
+    print(f"{'after (summary rows + json)':<34}{len(new_body):>10}{new_s * 1000:>10.2f}")
+    print(f"size: {len(old_body) / len(new_body):.1f}x smaller, time: {old_s / new_s:.1f}x faster")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+# EXPLAIN QUERY PLAN regression check for the hot query paths.
+# Builds the schema from models.py in an in-memory SQLite database, runs
+# each query through EXPLAIN QUERY PLAN and fails (exit 1) if a hot table
+# is read with a full table scan or a query needs a temp B-tree to sort.
+#
+#   python benchmarks/check_query_plans.py
+#
+# SQLite stands in for MySQL here: if the planner can't serve a query from
+# the indexes declared in models.py, MySQL won't either.
+import os
+import re
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.environ["DATABASE_URL"] = "sqlite://"
+
+from datetime import datetime  # noqa: E402
+
+from sqlalchemy import create_engine, select  # noqa: E402
+from sqlalchemy.dialects import sqlite  # noqa: E402
+from sqlalchemy.orm import Session  # noqa: E402
+
+import crud  # noqa: E402
+import lab_analytics  # noqa: E402
+from database import Base  # noqa: E402
+from models import LabResult, UserAllergies, UserDietaryRestriction  # noqa: E402
+
+USER = {"user_id": 1, "uid": 1, "limit": 50}
+
+
+def orm_sql(stmt):
+    return str(stmt.compile(dialect=sqlite.dialect(), compile_kwargs={"literal_binds": True}))
+
+
+# name → (sql, params, tables that may be scanned as a whole via an index)
+HOT_QUERIES = {
+    "latest lab result (/user/lab_result, DELETE /user/lab_result)": (
+        orm_sql(select(LabResult).filter(LabResult.user_id == 1)
+                .order_by(LabResult.uploaded_at.desc()).limit(1)),
+        {}, (),
+    ),
+    "lab history (/user/lab_results/history)": (crud.LAB_HISTORY_SQL, USER, ()),
+    "user profile (/user_info/{id})": (crud.USER_PROFILE_SQL, USER, ()),
+    "user profile batch (/user_info/batch)": (
+        crud.USER_PROFILE_BATCH_SQL.replace(":user_ids", "(1, 2, 3)"), {}, (),
+    ),
+    "saved recipes (/recipes/user/{id})": (
+        orm_sql(crud.saved_recipes_page_query(Session(), 1, 20).statement), {}, (),
+    ),
+    "saved recipes, later page (/recipes/user/{id}?cursor=)": (
+        orm_sql(crud.saved_recipes_page_query(Session(), 1, 20, (datetime(2025, 1, 1), 10)).statement),
+        {}, (),
+    ),
+    "ingredient search (/recipes/user/{id}/search)": ("""
+        SELECT token, recipe_id FROM saved_recipe_ingredients
+        WHERE user_id = :uid AND token IN ('chicken', 'rice', 'peanut')
+    """, USER, ()),
+    "user diets (/user/dietary_restrictions)": ("""
+        SELECT d.id, d.name, d.logo_path
+        FROM user_dietary_restrictions udr
+        JOIN dietary_restrictions d ON udr.dietary_id = d.id
+        WHERE udr.user_id = :uid
+    """, USER, ()),
+    "user allergies (/user/allergies)": ("""
+        SELECT a.id, a.name, a.logo_path
+        FROM user_allergies ua
+        JOIN allergies a ON ua.allergy_id = a.id
+        WHERE ua.user_id = :uid
+    """, USER, ()),
+    "user serving (/user/servings)": ("""
+        SELECT s.id, s.name, s.logo_path, us.family_count
+        FROM user_servings us
+        JOIN servings s ON us.serving_id = s.id
+        WHERE us.user_id = :uid
+    """, USER, ()),
+    "selection reconcile (PUT /user/dietary_restrictions)": (
+        orm_sql(select(UserDietaryRestriction.dietary_id).filter(UserDietaryRestriction.user_id == 1)),
+        {}, (),
+    ),
+    "selection delete (DELETE /user/allergies)": (
+        orm_sql(select(UserAllergies.allergy_id)
+                .filter(UserAllergies.user_id == 1, UserAllergies.allergy_id.in_([1, 2]))),
+        {}, (),
+    ),
+    # reads every row by design, but in index order: no sort
+    "cohort analytics (/analytics/lab_results)": (
+        lab_analytics.LAB_ANALYTICS_SQL.text, {}, ("lab_results",),
+    ),
+}
+
+_FULL_SCAN = re.compile(r"^SCAN (\w+)(?: AS \w+)?$")
+
+
+def plan_problems(conn, sql, params, scannable):
+    problems = []
+    plan = [row[3] for row in conn.execute("EXPLAIN QUERY PLAN " + sql, params)]
+    aliases = dict(re.findall(r"(?:FROM|JOIN)\s+(\w+)\s+(?:AS\s+)?(\w+)", sql, re.IGNORECASE))
+    aliases = {alias: table for table, alias in aliases.items()}
+    # derived tables are read back in full by design; only real tables count
+    derived = {d.split()[1] for d in plan if d.startswith("CO-ROUTINE ")}
+    for detail in plan:
+        if detail.startswith("SCAN ") and detail[5:].split(" USING")[0] in derived:
+            continue
+        if "TEMP B-TREE" in detail:
+            problems.append(detail)
+        match = _FULL_SCAN.match(detail)
+        if match:
+            # "SCAN t" with no index at all
+            table = aliases.get(match.group(1), match.group(1))
+            if table.lower() not in scannable:
+                problems.append(detail)
+        elif detail.startswith("SCAN ") and "INDEX" in detail:
+            table = detail.split()[1]
+            table = aliases.get(table, table)
+            if table.lower() not in scannable:
+                problems.append(detail)
+    return plan, problems
+
+
+def main():
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(bind=engine)
+    conn = engine.raw_connection().driver_connection
+
+    failed = 0
+    for name, (sql, params, scannable) in HOT_QUERIES.items():
+        plan, problems = plan_problems(conn, sql, params, scannable)
+        print(f"{'FAIL' if problems else 'ok  '}  {name}")
+        for detail in plan:
+            print(f"        {'✗' if detail in problems else ' '} {detail}")
+        failed += bool(problems)
+
+    print(f"\n{len(HOT_QUERIES) - failed}/{len(HOT_QUERIES)} hot queries use an index")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
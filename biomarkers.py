@@ -0,0 +1,155 @@
+import json
+import os
+import re
+from dataclasses import dataclass, field, replace
+
+# 🧬 Biomarker registry
+# Each entry says how to find a marker in report text, where it's stored on
+# LabResult and how to classify it. Adding a marker = adding an entry here
+# (plus its LabResult column). Bump lab_processing.EXTRACTOR_VERSION when
+# aliases or value patterns change.
+
+
+@dataclass(frozen=True)
+class Biomarker:
+    key: str                 # key in extract_lab_values() output, e.g. "LDL"
+    column: str              # LabResult column
+    aliases: tuple           # regexes for the label printed before the value
+    unit: str = "mg/dL"
+    value_pattern: str = r"[\d.]+"  # no capturing groups
+    # (upper bound, inclusive, status) checked in order; above all → default_status
+    bands: tuple = field(default=())
+    default_status: str = "High"
+
+    def classify(self, value):
+        for limit, inclusive, status in self.bands:
+            if value < limit or (inclusive and value == limit):
+                return status
+        return self.default_status
+
+
+BIOMARKERS = (
+    Biomarker(
+        key="LDL",
+        column="ldl",
+        aliases=(r"LDL[−\-]?C\s*(?:calculé)?",),
+        bands=((100, False, "Healthy"),),
+    ),
+    Biomarker(
+        key="HDL",
+        column="hdl",
+        aliases=(r"HDL[−\-]?C",),
+        bands=((40, False, "Low"), (60, False, "Healthy")),
+    ),
+    Biomarker(
+        key="Triglycerides",
+        column="triglycerides",
+        aliases=(r"Triglyc[ée]rides",),
+        bands=((150, False, "Healthy"),),
+    ),
+    Biomarker(
+        key="Glucose",
+        column="glucose",
+        aliases=(r"Glucose", r"Fasting Glucose"),
+        bands=((100, False, "Healthy"),),
+    ),
+    Biomarker(
+        key="Creatinine",
+        column="creatinine",
+        aliases=(r"Cr[ée]atinine",),
+        bands=((0.6, False, "Low"), (1.3, True, "Healthy")),
+    ),
+)
+
+# 📋 Reference ranges can be changed without a code change: point
+# REFERENCE_RANGES_FILE at a JSON table like
+#   {"LDL": {"bands": [[100, false, "Healthy"], [160, false, "Borderline"]], "default_status": "High"}}
+# Markers left out keep the bands above. Both classify_lab_results and the
+# NumPy batch classifier (lab_analytics) read the same table.
+REFERENCE_RANGES_FILE = os.getenv("REFERENCE_RANGES_FILE")
+
+
+def _apply_reference_ranges(markers, path):
+    with open(path) as f:
+        table = json.load(f)
+    unknown = set(table) - {m.key for m in markers}
+    if unknown:
+        raise ValueError(f"Unknown biomarkers in {path}: {sorted(unknown)}")
+
+    result = []
+    for m in markers:
+        entry = table.get(m.key)
+        if entry is None:
+            result.append(m)
+            continue
+        bands = tuple((float(limit), bool(inclusive), str(status)) for limit, inclusive, status in entry["bands"])
+        if any(a[0] > b[0] for a, b in zip(bands, bands[1:])):
+            raise ValueError(f"Bands for {m.key} must be in increasing order")
+        result.append(replace(m, bands=bands, default_status=entry.get("default_status", m.default_status)))
+    return tuple(result)
+
+
+if REFERENCE_RANGES_FILE:
+    BIOMARKERS = _apply_reference_ranges(BIOMARKERS, REFERENCE_RANGES_FILE)
+
+BIOMARKERS_BY_KEY = {m.key: m for m in BIOMARKERS}
+
+
+def reference_ranges():
+    return {
+        m.key: {
+            "unit": m.unit,
+            "bands": [list(band) for band in m.bands],
+            "default_status": m.default_status,
+        }
+        for m in BIOMARKERS
+    }
+
+_NUMBER = re.compile(r"^\d+(\.\d+)?$")
+
+
+def _compile(markers):
+    # one alternation with a named group per marker: m0, m1, ...
+    # (spaces in aliases match any run of whitespace, so the document text
+    # doesn't have to be normalized first)
+    parts = []
+    for i, m in enumerate(markers):
+        labels = "|".join(alias.replace(" ", r"\s+") for alias in m.aliases)
+        parts.append(rf"(?:{labels})\s*(?P<m{i}>{m.value_pattern})")
+    return re.compile("|".join(parts), re.IGNORECASE)
+
+
+_MATCHER = _compile(BIOMARKERS)
+
+
+class BiomarkerScanner:
+    # Feed text in pieces (e.g. page by page); the first hit for each marker
+    # wins, and `complete` flips once every registered marker has a value.
+    def __init__(self):
+        self.found = {}
+
+    @property
+    def complete(self):
+        return len(self.found) == len(BIOMARKERS)
+
+    def feed(self, text: str):
+        for match in _MATCHER.finditer(text):
+            group = match.lastgroup
+            marker = BIOMARKERS[int(group[1:])]
+            if marker.key in self.found:
+                continue
+            val = match.group(group)
+            self.found[marker.key] = float(val) if _NUMBER.match(val) else val.capitalize()
+            if self.complete:
+                break
+        return self.complete
+
+    def result(self):
+        return {m.key: self.found.get(m.key) for m in BIOMARKERS}
+
+
+def match_biomarkers(text: str):
+    # Single pass over the whole text
+    scanner = BiomarkerScanner()
+    scanner.feed(text)
+    return scanner.result()
@@ -0,0 +1,153 @@
+import gzip
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from fastapi import Request, Response
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from crud import get_catalog_rows, get_combined_catalog_rows
+from logo_assets import logo_url, logo_variants
+from models import DietaryRestriction, Allergy, Serving
+from response_cache import make_etag, not_modified, serialize
+
+# The onboarding catalogs almost never change, so each one is serialized once
+# per base URL and served as ready-made bytes with an ETag. ORM writes bump
+# the table version; the TTL picks up rows edited directly in MySQL.
+CATALOG_CACHE_TTL_SECONDS = int(os.getenv("CATALOG_CACHE_TTL_SECONDS", "300"))
+# entries are per base URL, which comes from the request's Host header:
+# bound them so arbitrary Host values can't grow the cache
+CATALOG_CACHE_MAX_ENTRIES = int(os.getenv("CATALOG_CACHE_MAX_ENTRIES", "64"))
+GZIP_MIN_BYTES = 512
+
+# Name of the combined /catalog entry, built from every table in CATALOG_MODELS
+COMBINED = "catalog"
+
+CATALOG_MODELS = {
+    "dietary_restrictions": DietaryRestriction,
+    "allergies": Allergy,
+    "servings": Serving,
+}
+
+_lock = threading.Lock()
+_versions = {name: 0 for name in CATALOG_MODELS}
+_entries = OrderedDict()  # (name, base_url) -> entry dict
+_stats = {"hits": 0, "misses": 0, "not_modified": 0, "invalidations": 0}
+
+
+def invalidate(name: str):
+    with _lock:
+        _versions[name] += 1
+        _stats["invalidations"] += 1
+        for key in [k for k in _entries if k[0] in (name, COMBINED)]:
+            del _entries[key]
+
+
+def _listen(model, name):
+    def on_change(mapper, connection, target):
+        invalidate(name)
+
+    for evt in ("after_insert", "after_update", "after_delete"):
+        event.listen(model, evt, on_change)
+
+
+for _name, _model in CATALOG_MODELS.items():
+    _listen(_model, _name)
+
+
+def _source_tables(name: str):
+    return list(CATALOG_MODELS) if name == COMBINED else [name]
+
+
+def _load(name: str, db: Session, base_url: str):
+    if name != COMBINED:
+        return catalog_items(get_catalog_rows(db, CATALOG_MODELS[name]), base_url)
+
+    grouped = {table: [] for table in CATALOG_MODELS}
+    for row in get_combined_catalog_rows(db, CATALOG_MODELS):
+        grouped[row.kind].append(row)
+    return {
+        table: catalog_items(sorted(rows, key=lambda r: r.id), base_url)
+        for table, rows in grouped.items()
+    }
+
+
+def catalog_items(rows, base_url: str):
+    return [
+        {
+            "id": r.id,
+            "name": r.name,
+            "logo_path": logo_url(base_url, r.logo_path),
+            "logo_variants": logo_variants(base_url, r.logo_path),
+        }
+        for r in rows
+    ]
+
+
+def get_entry(name: str, db: Session, base_url: str):
+    key = (name, base_url)
+    now = time.time()
+    with _lock:
+        version = tuple(_versions[t] for t in _source_tables(name))
+        entry = _entries.get(key)
+        if entry and entry["version"] == version and now - entry["built_at"] < CATALOG_CACHE_TTL_SECONDS:
+            _entries.move_to_end(key)
+            _stats["hits"] += 1
+            return entry
+        _stats["misses"] += 1
+
+    body = serialize(_load(name, db, base_url))
+    entry = {
+        "body": body,
+        "gzip_body": gzip.compress(body) if len(body) >= GZIP_MIN_BYTES else None,
+        "etag": make_etag(body),
+        "version": version,
+        "built_at": now,
+    }
+
+    with _lock:
+        # a write that landed while we were loading leaves this entry stale
+        if tuple(_versions[t] for t in _source_tables(name)) == version:
+            _entries[key] = entry
+            _entries.move_to_end(key)
+            while len(_entries) > CATALOG_CACHE_MAX_ENTRIES:
+                _entries.popitem(last=False)
+    return entry
+
+
+def accepts_gzip(request: Request):
+    return "gzip" in request.headers.get("accept-encoding", "").lower()
+
+
+def cached_response(request: Request, entry):
+    use_gzip = entry["gzip_body"] is not None and accepts_gzip(request)
+    etag = entry["etag"][:-1] + '-gzip"' if use_gzip else entry["etag"]
+    headers = {"ETag": etag, "Cache-Control": "no-cache", "Vary": "Accept-Encoding"}
+
+    response = not_modified(request, entry["etag"], headers)
+    if response is not None:
+        with _lock:
+            _stats["not_modified"] += 1
+        return response
+
+    if use_gzip:
+        headers["Content-Encoding"] = "gzip"
+        return Response(content=entry["gzip_body"], media_type="application/json", headers=headers)
+    return Response(content=entry["body"], media_type="application/json", headers=headers)
+
+
+def catalog_response(name: str, request: Request, db: Session):
+    base_url = str(request.base_url).rstrip('/')
+    return cached_response(request, get_entry(name, db, base_url))
+
+
+def stats():
+    with _lock:
+        return {
+            **_stats,
+            "entries": len(_entries),
+            "max_entries": CATALOG_CACHE_MAX_ENTRIES,
+            "versions": dict(_versions),
+        }
@@ -1,23 +1,25 @@
+from sqlalchemy import select
 from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from models import User, DietaryRestriction,UserAllergies,Allergy  # ✅ ADD DietaryRestriction HERE
-from passlib.context import CryptContext
 from models import UserServing, Serving  # ✅ Add this line!
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
 def get_user_by_email(db: Session, email: str):
     return db.query(User).filter(User.email == email).first()
 
-def create_user(db: Session, full_name: str, email: str, password: str):
-    hashed_password = pwd_context.hash(password)
+# ⚡ AsyncSession versions for async def handlers
+async def get_user_by_email_async(db: AsyncSession, email: str):
+    result = await db.execute(select(User).filter(User.email == email).limit(1))
+    return result.scalars().first()
+
+# password is hashed by the caller (see hashing.hash_password_async)
+async def create_user_async(db: AsyncSession, full_name: str, email: str, hashed_password: str):
     new_user = User(full_name=full_name, email=email, password=hashed_password)
     db.add(new_user)
-    db.commit()
-    db.refresh(new_user)
+    await db.commit()
+    await db.refresh(new_user)
     return new_user
 
-def verify_password(plain, hashed):
-    return pwd_context.verify(plain, hashed)
-
 # ✅ New function
 def get_all_dietary_restrictions(db: Session):
     return db.query(DietaryRestriction).all()
@@ -25,30 +27,29 @@ def get_all_dietary_restrictions(db: Session):
 from models import UserDietaryRestriction
 
 def save_user_dietary_restrictions(db: Session, user_id: int, dietary_ids: list[int]):
-    # Delete old selections first
-    db.query(UserDietaryRestriction).filter(UserDietaryRestriction.user_id == user_id).delete()
-
-    # Insert new selections
-    for d_id in dietary_ids:
-        db.add(UserDietaryRestriction(user_id=user_id, dietary_id=d_id))
-
-    db.commit()
-    return {"message": "Dietary restrictions saved successfully."}
+    changes = reconcile_user_selection(db, UserDietaryRestriction, "dietary_id", user_id, dietary_ids)
+    return {"message": "Dietary restrictions saved successfully.", **changes}
 
 
 def get_all_allergies(db):
     return db.query(Allergy).all()
 
 def save_user_allergies(db: Session, user_id: int, allergy_ids: list[int]):
-    # Delete old selections first
-    db.query(UserAllergies).filter(UserAllergies.user_id == user_id).delete()
+    changes = reconcile_user_selection(db, UserAllergies, "allergy_id", user_id, allergy_ids)
+    return {"message": "Allergies saved successfully.", **changes}
 
-    # Insert new selections
-    for d_id in allergy_ids:
-        db.add(UserAllergies(user_id=user_id, allergy_id=d_id))
+# Plain (id, name, logo_path) rows for the catalog cache — no ORM instances
+def get_catalog_rows(db: Session, model):
+    return db.query(model.id, model.name, model.logo_path).order_by(model.id).all()
 
-    db.commit()
-    return {"message": "Allergies saved successfully."}
+# Every catalog in one UNION ALL round trip, tagged with its catalog name
+def get_combined_catalog_rows(db: Session, models: dict):
+    from sqlalchemy import literal, select, union_all
+    query = union_all(*[
+        select(literal(name).label("kind"), model.id, model.name, model.logo_path)
+        for name, model in models.items()
+    ])
+    return db.execute(query).all()
 
 def get_all_servings(db):
     from models import Serving
@@ -63,3 +64,285 @@ def save_user_serving(db: Session, user_id: int, serving_id: int, family_count:
     db.commit()
     db.refresh(new_entry)
     return new_entry
+
+# 🧠 Everything /user_info needs in one round trip, one row per item tagged by kind.
+# The lab columns come from the biomarker registry, like LAB_HISTORY_SQL.
+def _user_profile_sql():
+    from biomarkers import BIOMARKERS
+    lab_columns = ", ".join(f"l.{m.column}" for m in BIOMARKERS)
+    null_columns = ", ".join(f"NULL AS {m.column}" for m in BIOMARKERS)
+    nulls = ", ".join("NULL" for _ in BIOMARKERS)
+    return f"""
+    SELECT 'user' AS kind, u.id AS id, NULL AS name, NULL AS logo_path, NULL AS family_count,
+           NULL AS filename, {null_columns}
+    FROM users u
+    WHERE u.id = :user_id
+    UNION ALL
+    SELECT 'diet', d.id, d.name, d.logo_path, NULL, NULL, {nulls}
+    FROM user_dietary_restrictions udr
+    JOIN dietary_restrictions d ON udr.dietary_id = d.id
+    WHERE udr.user_id = :user_id
+    UNION ALL
+    SELECT 'allergy', a.id, a.name, a.logo_path, NULL, NULL, {nulls}
+    FROM user_allergies ua
+    JOIN allergies a ON ua.allergy_id = a.id
+    WHERE ua.user_id = :user_id
+    UNION ALL
+    SELECT 'serving', s.id, s.name, s.logo_path, us.family_count, NULL, {nulls}
+    FROM user_servings us
+    JOIN servings s ON us.serving_id = s.id
+    WHERE us.user_id = :user_id
+    UNION ALL
+    SELECT 'lab', l.id, NULL, NULL, NULL, l.filename, {lab_columns}
+    FROM lab_results l
+    WHERE l.id = (
+        SELECT id FROM lab_results
+        WHERE user_id = :user_id
+        ORDER BY uploaded_at DESC, id DESC
+        LIMIT 1
+    )
+"""
+
+USER_PROFILE_SQL = _user_profile_sql()
+
+def get_user_profile_rows(db: Session, user_id: int):
+    from sqlalchemy import text
+    return db.execute(text(USER_PROFILE_SQL), {"user_id": user_id}).fetchall()
+
+# Same row shape as USER_PROFILE_SQL plus user_id, for many users at once.
+# Latest lab per user is a correlated LIMIT 1 seek on ix_lab_results_user_uploaded
+# for each requested user, not a sort over all of their labs.
+def _user_profile_batch_sql():
+    from biomarkers import BIOMARKERS
+    lab_columns = ", ".join(f"l.{m.column}" for m in BIOMARKERS)
+    null_columns = ", ".join(f"NULL AS {m.column}" for m in BIOMARKERS)
+    nulls = ", ".join("NULL" for _ in BIOMARKERS)
+    return f"""
+    SELECT u.id AS user_id, 'user' AS kind, u.id AS id, NULL AS name, NULL AS logo_path,
+           NULL AS family_count, NULL AS filename, {null_columns}
+    FROM users u
+    WHERE u.id IN :user_ids
+    UNION ALL
+    SELECT udr.user_id, 'diet', d.id, d.name, d.logo_path, NULL, NULL, {nulls}
+    FROM user_dietary_restrictions udr
+    JOIN dietary_restrictions d ON udr.dietary_id = d.id
+    WHERE udr.user_id IN :user_ids
+    UNION ALL
+    SELECT ua.user_id, 'allergy', a.id, a.name, a.logo_path, NULL, NULL, {nulls}
+    FROM user_allergies ua
+    JOIN allergies a ON ua.allergy_id = a.id
+    WHERE ua.user_id IN :user_ids
+    UNION ALL
+    SELECT us.user_id, 'serving', s.id, s.name, s.logo_path, us.family_count, NULL, {nulls}
+    FROM user_servings us
+    JOIN servings s ON us.serving_id = s.id
+    WHERE us.user_id IN :user_ids
+    UNION ALL
+    SELECT l.user_id, 'lab', l.id, NULL, NULL, NULL, l.filename, {lab_columns}
+    FROM users u
+    JOIN lab_results l ON l.id = (
+        SELECT id FROM lab_results
+        WHERE user_id = u.id
+        ORDER BY uploaded_at DESC, id DESC
+        LIMIT 1
+    )
+    WHERE u.id IN :user_ids
+"""
+
+USER_PROFILE_BATCH_SQL = _user_profile_batch_sql()
+
+def get_user_profile_rows_batch(db: Session, user_ids: list[int]):
+    from sqlalchemy import bindparam, text
+    query = text(USER_PROFILE_BATCH_SQL).bindparams(bindparam("user_ids", expanding=True))
+    return db.execute(query, {"user_ids": user_ids}).fetchall()
+
+# ✅ Multi-row INSERT that skips rows already present (safe for client retries).
+# These don't commit, so several can share one transaction. Nothing is
+# returned: rowcount can't tell inserted rows from skipped ones on MySQL
+# (the driver reports matched rows, so every duplicate counts as 1).
+def insert_ignore(db: Session, model, rows: list[dict]):
+    if not rows:
+        return
+    dialect = db.get_bind().dialect.name
+    if dialect == "mysql":
+        from sqlalchemy.dialects.mysql import insert
+        stmt = insert(model).values(rows)
+        # no-op update: duplicates are left untouched
+        pk = model.__table__.primary_key.columns.values()[0].name
+        stmt = stmt.on_duplicate_key_update({pk: stmt.inserted[pk]})
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+        stmt = insert(model).values(rows).on_conflict_do_nothing()
+    db.execute(stmt)
+
+def add_user_dietary_restrictions(db: Session, user_id: int, dietary_ids: list[int]):
+    rows = [{"user_id": user_id, "dietary_id": d_id} for d_id in dict.fromkeys(dietary_ids)]
+    insert_ignore(db, UserDietaryRestriction, rows)
+
+def add_user_allergies(db: Session, user_id: int, allergy_ids: list[int]):
+    rows = [{"user_id": user_id, "allergy_id": a_id} for a_id in dict.fromkeys(allergy_ids)]
+    insert_ignore(db, UserAllergies, rows)
+
+def replace_user_serving(db: Session, user_id: int, serving_id: int, family_count: int):
+    db.query(UserServing).filter(UserServing.user_id == user_id).delete()
+    db.add(UserServing(user_id=user_id, serving_id=serving_id, family_count=family_count))
+
+# 🔁 Make a user's join-table selection match `ids` with the fewest writes:
+# one bulk DELETE for removed ids, one multi-row INSERT for added ids, and
+# no writes (or commit) at all when nothing changed.
+def reconcile_user_selection(db: Session, model, id_field: str, user_id: int, ids: list[int]):
+    column = getattr(model, id_field)
+    current = {row[0] for row in db.query(column).filter(model.user_id == user_id)}
+    wanted = set(ids)
+
+    added = sorted(wanted - current)
+    removed = sorted(current - wanted)
+    if not added and not removed:
+        return {"changed": False, "added": [], "removed": []}
+
+    if removed:
+        db.query(model).filter(model.user_id == user_id, column.in_(removed)).delete(synchronize_session=False)
+    insert_ignore(db, model, [{"user_id": user_id, id_field: i} for i in added])
+    db.commit()
+    return {"changed": True, "added": added, "removed": removed}
+
+# 🗑️ Remove several ids from a user's selection with one DELETE ... IN (...)
+# and one commit; returns the ids that were actually there.
+def delete_user_selection(db: Session, model, id_field: str, user_id: int, ids: list[int]):
+    column = getattr(model, id_field)
+    ids = list(dict.fromkeys(ids))
+    if not ids:
+        return []
+
+    removed = sorted(
+        row[0] for row in db.query(column)
+        .filter(model.user_id == user_id, column.in_(ids))
+        .with_for_update()
+    )
+    if removed:
+        db.query(model).filter(model.user_id == user_id, column.in_(removed)).delete(synchronize_session=False)
+    db.commit()
+    return removed
+
+# 🧬 Store extracted biomarkers as a LabResult row
+def create_lab_result(db: Session, user_id: int, filename: str, extracted: dict,
+                      file_digest: str | None = None, file_size: int | None = None,
+                      job_id: str | None = None):
+    from biomarkers import BIOMARKERS
+    from models import LabResult
+    lab = LabResult(
+        user_id=user_id,
+        filename=filename,
+        file_digest=file_digest,
+        file_size=file_size,
+        job_id=job_id,
+        **{m.column: extracted.get(m.key) for m in BIOMARKERS}
+    )
+    db.add(lab)
+    db.commit()
+    db.refresh(lab)
+    return lab
+
+async def create_lab_result_async(db: AsyncSession, user_id: int, filename: str, extracted: dict,
+                                  file_digest: str | None = None, file_size: int | None = None):
+    from biomarkers import BIOMARKERS
+    from models import LabResult
+    lab = LabResult(
+        user_id=user_id,
+        filename=filename,
+        file_digest=file_digest,
+        file_size=file_size,
+        **{m.column: extracted.get(m.key) for m in BIOMARKERS}
+    )
+    db.add(lab)
+    await db.commit()
+    await db.refresh(lab)
+    return lab
+
+# 📈 Newest rows first: a bounded backward range scan on
+# ix_lab_results_user_uploaded (user_id, uploaded_at)
+def _lab_history_sql():
+    from biomarkers import BIOMARKERS
+    columns = ", ".join(m.column for m in BIOMARKERS)
+    return f"""
+    SELECT id, filename, uploaded_at, {columns}
+    FROM lab_results
+    WHERE user_id = :user_id
+    ORDER BY uploaded_at DESC, id DESC
+    LIMIT :limit
+"""
+
+LAB_HISTORY_SQL = _lab_history_sql()
+
+def get_lab_history_rows(db: Session, user_id: int, limit: int):
+    from sqlalchemy import text
+    return db.execute(text(LAB_HISTORY_SQL), {"user_id": user_id, "limit": limit}).fetchall()
+
+# 📖 One page of a user's saved recipes, newest first. Keyset on
+# (created_at, id) instead of OFFSET, so every page is a range scan of
+# ix_saved_recipes_user_created that starts where the last one stopped.
+# Only the list-screen columns are selected (no ingredients/steps blobs).
+# Fetches limit + 1 rows; the caller trims and uses the extra as "has more".
+RECIPE_SUMMARY_COLUMNS = ("id", "recipe_name", "calories", "protein", "carbs", "fat", "servings", "created_at")
+
+def recipe_summary(row):
+    return {
+        "id": row.id,
+        "recipe_name": row.recipe_name,
+        "calories": row.calories,
+        "protein": row.protein,
+        "carbs": row.carbs,
+        "fat": row.fat,
+        "servings": row.servings,
+        "created_at": row.created_at.isoformat() if row.created_at else None,
+    }
+
+
+def saved_recipes_page_query(db: Session, user_id: int, limit: int, after: tuple | None = None):
+    from sqlalchemy import and_, not_
+    from models import SavedRecipe
+    columns = [getattr(SavedRecipe, name) for name in RECIPE_SUMMARY_COLUMNS]
+    query = db.query(*columns).filter(SavedRecipe.user_id == user_id)
+    if after is not None:
+        # (created_at, id) < after, spelled out: MySQL won't use a row-value
+        # comparison as an index range, but does use created_at <= :c
+        created_at, recipe_id = after
+        query = query.filter(
+            SavedRecipe.created_at <= created_at,
+            not_(and_(SavedRecipe.created_at == created_at, SavedRecipe.id >= recipe_id)),
+        )
+    return query.order_by(SavedRecipe.created_at.desc(), SavedRecipe.id.desc()).limit(limit + 1)
+
+def get_saved_recipes_page(db: Session, user_id: int, limit: int, after: tuple | None = None):
+    return saved_recipes_page_query(db, user_id, limit, after).all()
+
+def get_saved_recipe(db: Session, recipe_id: int):
+    from models import SavedRecipe
+    return db.query(SavedRecipe).filter(SavedRecipe.id == recipe_id).first()
+
+# 📦 Bulk save: one multi-row INSERT, no commit (the caller commits once)
+def create_saved_recipes(db: Session, rows: list[dict]):
+    from sqlalchemy import insert
+    from models import SavedRecipe
+    stmt = insert(SavedRecipe).values(rows)
+    if db.get_bind().dialect.insert_returning:
+        # SQLite / MariaDB / PostgreSQL: INSERT ... VALUES (...), (...) RETURNING id.
+        # Ids are assigned row by row within the statement, so ascending = input
+        # order (RETURNING itself doesn't promise an order)
+        return sorted(db.execute(stmt.returning(SavedRecipe.id)).scalars())
+    # MySQL has no RETURNING: InnoDB allocates the ids of a multi-row VALUES
+    # insert in one go (consecutive with auto_increment_increment = 1) and
+    # LAST_INSERT_ID() is the first of them
+    first = db.execute(stmt).lastrowid
+    return list(range(first, first + len(rows)))
+
+def get_saved_recipe_summaries(db: Session, recipe_ids: list[int], limit: int):
+    from models import SavedRecipe
+    columns = [getattr(SavedRecipe, name) for name in RECIPE_SUMMARY_COLUMNS]
+    return (
+        db.query(*columns)
+        .filter(SavedRecipe.id.in_(recipe_ids))
+        .order_by(SavedRecipe.created_at.desc(), SavedRecipe.id.desc())
+        .limit(limit)
+        .all()
+    )
@@ -0,0 +1,110 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+# 🧬 Persistent cache of extract_lab_values output, keyed by the sha256 of the
+# uploaded bytes and the extractor version, so re-uploading the same PDF
+# skips PyMuPDF/OCR entirely. Entries expire by age and the least recently
+# used ones are dropped past EXTRACTION_CACHE_MAX_ENTRIES.
+EXTRACTION_CACHE_DB = os.getenv("EXTRACTION_CACHE_DB", "lab_extraction_cache.sqlite3")
+EXTRACTION_CACHE_MAX_ENTRIES = int(os.getenv("EXTRACTION_CACHE_MAX_ENTRIES", "20000"))
+EXTRACTION_CACHE_MAX_AGE_DAYS = int(os.getenv("EXTRACTION_CACHE_MAX_AGE_DAYS", "90"))
+
+_lock = threading.Lock()
+# lookups happen in the API process; stores happen in the lab job workers
+_stats = {"hits": 0, "misses": 0}
+_initialized = False
+
+
+@contextmanager
+def _connect():
+    global _initialized
+    conn = sqlite3.connect(EXTRACTION_CACHE_DB, timeout=30)
+    try:
+        with conn:
+            if not _initialized:
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.execute("""
+                    CREATE TABLE IF NOT EXISTS extraction_cache (
+                        digest TEXT NOT NULL,
+                        extractor_version TEXT NOT NULL,
+                        result TEXT NOT NULL,
+                        created_at REAL NOT NULL,
+                        last_used_at REAL NOT NULL,
+                        PRIMARY KEY (digest, extractor_version)
+                    )
+                """)
+                conn.execute(
+                    "CREATE INDEX IF NOT EXISTS ix_extraction_cache_last_used "
+                    "ON extraction_cache (last_used_at)"
+                )
+                _initialized = True
+            yield conn
+    finally:
+        conn.close()
+
+
+def _count(key: str):
+    with _lock:
+        _stats[key] += 1
+
+
+def get(digest: str, extractor_version: str):
+    min_created = time.time() - EXTRACTION_CACHE_MAX_AGE_DAYS * 86400
+    with _connect() as conn:
+        row = conn.execute(
+            "SELECT result FROM extraction_cache "
+            "WHERE digest = ? AND extractor_version = ? AND created_at >= ?",
+            (digest, extractor_version, min_created),
+        ).fetchone()
+        if row is not None:
+            conn.execute(
+                "UPDATE extraction_cache SET last_used_at = ? WHERE digest = ? AND extractor_version = ?",
+                (time.time(), digest, extractor_version),
+            )
+    if row is None:
+        _count("misses")
+        return None
+    _count("hits")
+    return json.loads(row[0])
+
+
+def put(digest: str, extractor_version: str, extracted: dict):
+    now = time.time()
+    with _connect() as conn:
+        conn.execute(
+            "INSERT OR REPLACE INTO extraction_cache "
+            "(digest, extractor_version, result, created_at, last_used_at) VALUES (?, ?, ?, ?, ?)",
+            (digest, extractor_version, json.dumps(extracted), now, now),
+        )
+    evict()
+
+
+def evict():
+    min_created = time.time() - EXTRACTION_CACHE_MAX_AGE_DAYS * 86400
+    with _connect() as conn:
+        conn.execute("DELETE FROM extraction_cache WHERE created_at < ?", (min_created,))
+        overflow = conn.execute("SELECT COUNT(*) FROM extraction_cache").fetchone()[0] - EXTRACTION_CACHE_MAX_ENTRIES
+        if overflow > 0:
+            conn.execute(
+                "DELETE FROM extraction_cache WHERE rowid IN ("
+                "SELECT rowid FROM extraction_cache ORDER BY last_used_at LIMIT ?)",
+                (overflow,),
+            )
+
+
+def stats():
+    with _connect() as conn:
+        entries = conn.execute("SELECT COUNT(*) FROM extraction_cache").fetchone()[0]
+    with _lock:
+        lookups = _stats["hits"] + _stats["misses"]
+        return {
+            **_stats,
+            "entries": entries,
+            "max_entries": EXTRACTION_CACHE_MAX_ENTRIES,
+            "max_age_days": EXTRACTION_CACHE_MAX_AGE_DAYS,
+            "hit_rate": round(_stats["hits"] / lookups, 4) if lookups else 0.0,
+        }
@@ -0,0 +1,95 @@
+import asyncio
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from fastapi import HTTPException
+from passlib.context import CryptContext
+
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+
+# bcrypt is CPU bound, so it runs in its own process pool instead of the
+# Starlette threadpool. Jobs beyond workers + HASH_QUEUE_MAX get a 503.
+HASH_WORKERS = int(os.getenv("HASH_WORKERS", str(os.cpu_count() or 1)))
+HASH_QUEUE_MAX = int(os.getenv("HASH_QUEUE_MAX", str(HASH_WORKERS * 4)))
+
+_executor = None
+_in_flight = 0
+_rejected = 0
+_completed = 0
+_latencies_ms = deque(maxlen=1000)
+
+
+def _hash(password: str):
+    return pwd_context.hash(password)
+
+
+def _verify(plain: str, hashed: str):
+    return pwd_context.verify(plain, hashed)
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(max_workers=HASH_WORKERS)
+    return _executor
+
+
+async def _submit(fn, *args):
+    global _in_flight, _rejected, _completed
+    if _in_flight >= HASH_WORKERS + HASH_QUEUE_MAX:
+        _rejected += 1
+        raise HTTPException(
+            status_code=503,
+            detail="Server busy, please retry",
+            headers={"Retry-After": "1"},
+        )
+
+    _in_flight += 1
+    start = time.perf_counter()
+    try:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(_get_executor(), fn, *args)
+    finally:
+        _in_flight -= 1
+        _completed += 1
+        _latencies_ms.append((time.perf_counter() - start) * 1000)
+
+
+async def hash_password_async(password: str):
+    return await _submit(_hash, password)
+
+
+async def verify_password_async(plain: str, hashed: str):
+    if not hashed:
+        return False
+    return await _submit(_verify, plain, hashed)
+
+
+def shutdown():
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+
+
+def stats():
+    samples = sorted(_latencies_ms)
+
+    def pct(p):
+        if not samples:
+            return None
+        return round(samples[min(len(samples) - 1, int(len(samples) * p))], 2)
+
+    return {
+        "workers": HASH_WORKERS,
+        "queue_max": HASH_QUEUE_MAX,
+        "in_flight": _in_flight,
+        "queue_depth": max(0, _in_flight - HASH_WORKERS),
+        "completed": _completed,
+        "rejected": _rejected,
+        "latency_ms_p50": pct(0.50),
+        "latency_ms_p95": pct(0.95),
+        "latency_ms_max": round(samples[-1], 2) if samples else None,
+    }
@@ -0,0 +1,163 @@
+import json
+import re
+import unicodedata
+
+from sqlalchemy import bindparam, insert, text
+from sqlalchemy.orm import Session
+
+from crud import insert_ignore
+from models import SavedRecipeIngredient
+
+# 🔎 Ingredient tokens for saved_recipe_ingredients.
+# "2 boneless skinless chicken breasts, cut into 1-inch cubes" → {"chicken", "breast"}:
+# lowercased, accents stripped, quantities/units/prep words dropped and
+# plurals folded. A search term goes through the same function, and a
+# multi-word term ("peanut butter") matches recipes that have all its tokens.
+INGREDIENT_BACKFILL_CHUNK_SIZE = 500
+
+_WORD = re.compile(r"[a-z]+")
+
+STOPWORDS = {
+    # units
+    "cup", "cups", "tbsp", "tsp", "tablespoon", "tablespoons", "teaspoon", "teaspoons",
+    "g", "kg", "mg", "ml", "l", "oz", "ounce", "ounces", "lb", "lbs", "pound", "pounds",
+    "gram", "grams", "liter", "liters", "litre", "litres", "pinch", "dash", "handful",
+    "piece", "pieces", "can", "cans", "package", "inch", "x",
+    # preparation / size
+    "chopped", "minced", "sliced", "diced", "grated", "crushed", "peeled", "cut", "cubed",
+    "fresh", "freshly", "ground", "large", "medium", "small", "finely", "thinly", "roughly",
+    "cooked", "boneless", "skinless", "optional", "whole", "halved", "divided", "softened",
+    "melted", "beaten", "room", "temperature",
+    # filler
+    "a", "an", "the", "and", "or", "of", "for", "to", "taste", "into", "about", "with", "in",
+    "plus", "more", "as", "needed", "some",
+}
+
+
+def canonical(word: str):
+    # naive plural folding: berries → berry, tomatoes → tomato, eggs → egg
+    if len(word) > 4 and word.endswith("ies"):
+        return word[:-3] + "y"
+    if len(word) > 4 and word.endswith("oes"):
+        return word[:-2]
+    if len(word) > 4 and word.endswith(("ches", "shes", "sses", "xes")):
+        return word[:-2]
+    if len(word) > 3 and word.endswith("s") and not word.endswith(("ss", "us", "is")):
+        return word[:-1]
+    return word
+
+
+def tokens(phrase: str):
+    normalized = unicodedata.normalize("NFKD", phrase.lower())
+    normalized = "".join(c for c in normalized if not unicodedata.combining(c))
+    return {
+        canonical(word)[:64]
+        for word in _WORD.findall(normalized)
+        if word not in STOPWORDS and len(word) > 1
+    }
+
+
+def ingredient_tokens(ingredients):
+    result = set()
+    for ingredient in ingredients:
+        result |= tokens(ingredient)
+    return result
+
+
+def index_rows(recipe_id: int, user_id: int, ingredients):
+    return [
+        {"user_id": user_id, "token": token, "recipe_id": recipe_id}
+        for token in sorted(ingredient_tokens(ingredients))
+    ]
+
+
+def add_to_index(db: Session, rows: list[dict]):
+    # same transaction as the recipe insert; doesn't commit
+    if rows:
+        db.execute(insert(SavedRecipeIngredient), rows)
+
+
+def decode_recipe_list(raw):
+    # ingredients/steps are stored as json.dumps(list); very old rows may hold plain text
+    if not raw:
+        return []
+    try:
+        value = json.loads(raw)
+    except ValueError:
+        return [raw]
+    return value if isinstance(value, list) else [str(value)]
+
+
+def backfill(db: Session, chunk_size: int = INGREDIENT_BACKFILL_CHUNK_SIZE):
+    # index recipes saved before the index existed; keyset over
+    # saved_recipes.id so it runs in bounded memory. Every worker runs this
+    # at startup, so rows another worker already wrote are skipped, and
+    # recipes are marked done even when their ingredients gave no tokens.
+    indexed = 0
+    last_id = 0
+    while True:
+        recipes = db.execute(text("""
+            SELECT id, user_id, ingredients
+            FROM saved_recipes
+            WHERE id > :last_id AND ingredients_indexed IS NULL
+            ORDER BY id
+            LIMIT :limit
+        """), {"last_id": last_id, "limit": chunk_size}).fetchall()
+        if not recipes:
+            break
+        rows = []
+        for recipe in recipes:
+            rows += index_rows(recipe.id, recipe.user_id, decode_recipe_list(recipe.ingredients))
+        insert_ignore(db, SavedRecipeIngredient, rows)
+        db.execute(
+            text("UPDATE saved_recipes SET ingredients_indexed = :done WHERE id IN :ids")
+            .bindparams(bindparam("ids", expanding=True)),
+            {"done": True, "ids": [recipe.id for recipe in recipes]},
+        )
+        db.commit()
+        indexed += len(recipes)
+        last_id = recipes[-1].id
+    return indexed
+
+
+def _term_tokens(terms):
+    # "chicken, rice" and repeated ?include= both work
+    result = []
+    for term in terms:
+        for part in term.split(","):
+            part_tokens = tokens(part)
+            if part_tokens:
+                result.append(part_tokens)
+    return result
+
+
+def search_recipe_ids(db: Session, user_id: int, include, exclude):
+    include_terms = _term_tokens(include)
+    exclude_terms = _term_tokens(exclude)
+    wanted = set().union(*include_terms, *exclude_terms)
+
+    # one index lookup for every token involved: token → recipe ids
+    postings = {token: set() for token in wanted}
+    if wanted:
+        rows = db.execute(
+            text("""
+                SELECT token, recipe_id FROM saved_recipe_ingredients
+                WHERE user_id = :user_id AND token IN :tokens
+            """).bindparams(bindparam("tokens", expanding=True)),
+            {"user_id": user_id, "tokens": sorted(wanted)},
+        )
+        for token, recipe_id in rows:
+            postings[token].add(recipe_id)
+
+    def matching(term):
+        return set.intersection(*(postings[token] for token in term))
+
+    if include_terms:
+        ids = set.intersection(*(matching(term) for term in include_terms))
+    else:
+        ids = {row[0] for row in db.execute(
+            text("SELECT id FROM saved_recipes WHERE user_id = :user_id"), {"user_id": user_id}
+        )}
+    for term in exclude_terms:
+        ids -= matching(term)
+    return ids
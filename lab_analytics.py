@@ -0,0 +1,219 @@
+import os
+import threading
+import time
+
+import numpy as np
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from biomarkers import BIOMARKERS, reference_ranges
+
+# 📊 Cohort analytics over lab_results
+# Each user counts once, with their latest result. Rows are streamed from a
+# single ordered query in LAB_ANALYTICS_CHUNK_SIZE partitions and reduced
+# into fixed-size accumulators (status counts + a log-spaced histogram per
+# marker), so memory stays flat no matter how many rows there are.
+# Percentiles are read off the histogram (≈0.5% relative error).
+# Groups smaller than LAB_ANALYTICS_MIN_GROUP_SIZE users are left out of the
+# report (signup months) or reported without percentiles (markers), so no
+# cell describes one or two identifiable people.
+LAB_ANALYTICS_CHUNK_SIZE = 50_000
+LAB_ANALYTICS_MIN_GROUP_SIZE = int(os.getenv("LAB_ANALYTICS_MIN_GROUP_SIZE", "10"))
+LAB_ANALYTICS_TTL_SECONDS = 300
+PERCENTILES = (5, 25, 50, 75, 95)
+
+# histogram bins shared by all markers: 0.01 … 10000 in the marker's unit
+_EDGES = np.geomspace(0.01, 10_000, 2_001)
+
+_COLUMNS = ", ".join(f"l.{m.column}" for m in BIOMARKERS)
+LAB_ANALYTICS_SQL = text(f"""
+    SELECT l.user_id, u.created_at, {_COLUMNS}
+    FROM lab_results l
+    JOIN users u ON u.id = l.user_id
+    ORDER BY l.user_id, l.uploaded_at, l.id
+""")
+
+_lock = threading.Lock()
+_cached = None
+_stats = {"builds": 0, "cache_hits": 0, "last_build_seconds": None, "last_rows_scanned": 0}
+
+
+def status_labels(marker):
+    # status code i ↔ labels[i]; the last one is the default (above all bands)
+    return [status for _, _, status in marker.bands] + [marker.default_status]
+
+
+def classify_values(marker, values: np.ndarray):
+    # Vectorized Biomarker.classify: status code per value, -1 for NaN (missing).
+    # Bands are checked in order and the first match wins, as in the scalar version.
+    codes = np.full(values.shape, len(marker.bands), dtype=np.int8)
+    unassigned = ~np.isnan(values)
+    codes[~unassigned] = -1
+    for i, (limit, inclusive, _) in enumerate(marker.bands):
+        hit = unassigned & ((values <= limit) if inclusive else (values < limit))
+        codes[hit] = i
+        unassigned &= ~hit
+    return codes
+
+
+class _Accumulator:
+    def __init__(self):
+        self.users = 0
+        self.rows = 0
+        self.labels = {m.key: status_labels(m) for m in BIOMARKERS}
+        self.counts = {m.key: np.zeros(len(self.labels[m.key]), dtype=np.int64) for m in BIOMARKERS}
+        self.hist = {m.key: np.zeros(len(_EDGES) + 1, dtype=np.int64) for m in BIOMARKERS}
+        # "YYYY-MM" → {"users": n, marker key → status counts}
+        self.months = {}
+
+    def add(self, months: np.ndarray, values: np.ndarray):
+        # one row per user (their latest result); values: users × markers
+        self.users += len(months)
+        labels = np.where(np.isnat(months), "unknown", months.astype(str))
+        month_keys, month_idx = np.unique(labels, return_inverse=True)
+        month_users = np.bincount(month_idx, minlength=len(month_keys))
+        for key, n in zip(month_keys, month_users):
+            entry = self.months.setdefault(str(key), {"users": 0})
+            entry["users"] += int(n)
+
+        for j, marker in enumerate(BIOMARKERS):
+            column = values[:, j]
+            codes = classify_values(marker, column)
+            present = codes >= 0
+            n_status = len(self.labels[marker.key])
+            self.counts[marker.key] += np.bincount(codes[present], minlength=n_status)
+
+            measured = column[present]
+            bins = np.searchsorted(_EDGES, measured, side="right")
+            self.hist[marker.key] += np.bincount(bins, minlength=len(_EDGES) + 1)
+
+            # status counts per signup month in one bincount
+            combined = month_idx[present] * n_status + codes[present]
+            per_month = np.bincount(combined, minlength=len(month_keys) * n_status).reshape(-1, n_status)
+            for key, row in zip(month_keys, per_month):
+                entry = self.months[str(key)].setdefault(marker.key, np.zeros(n_status, dtype=np.int64))
+                entry += row
+
+    def percentiles(self, key: str):
+        hist = self.hist[key]
+        total = hist.sum()
+        if total == 0:
+            return {f"p{p}": None for p in PERCENTILES}
+        cumulative = np.cumsum(hist)
+        result = {}
+        for p in PERCENTILES:
+            target = total * p / 100
+            b = int(np.searchsorted(cumulative, target, side="left"))
+            # bin b covers [_EDGES[b-1], _EDGES[b]); the outer bins are open-ended
+            lo = _EDGES[max(b - 1, 0)]
+            hi = _EDGES[min(b, len(_EDGES) - 1)]
+            before = cumulative[b - 1] if b > 0 else 0
+            frac = (target - before) / hist[b] if hist[b] else 0.0
+            result[f"p{p}"] = round(float(lo + (hi - lo) * frac), 2)
+        return result
+
+    def report(self, min_group: int = LAB_ANALYTICS_MIN_GROUP_SIZE):
+        markers = {}
+        for m in BIOMARKERS:
+            counts = self.counts[m.key]
+            n = int(counts.sum())
+            labels = self.labels[m.key]
+            if n < min_group:
+                markers[m.key] = {"unit": m.unit, "n": n, "suppressed": True}
+                continue
+            status_counts = {}
+            for label, c in zip(labels, counts):
+                status_counts[label] = status_counts.get(label, 0) + int(c)
+            markers[m.key] = {
+                "unit": m.unit,
+                "n": n,
+                "status_counts": status_counts,
+                "status_share": {label: round(c / n, 4) if n else 0.0 for label, c in status_counts.items()},
+                "percentiles": self.percentiles(m.key),
+            }
+
+        by_month = {}
+        suppressed = {"months": 0, "users": 0}
+        for month in sorted(self.months):
+            entry = self.months[month]
+            if entry["users"] < min_group:
+                suppressed["months"] += 1
+                suppressed["users"] += entry["users"]
+                continue
+            by_month[month] = {"users": entry["users"]}
+            for m in BIOMARKERS:
+                counts = entry.get(m.key)
+                if counts is None:
+                    continue
+                by_status = {}
+                for label, c in zip(self.labels[m.key], counts):
+                    by_status[label] = by_status.get(label, 0) + int(c)
+                by_month[month][m.key] = by_status
+
+        return {
+            "users": self.users,
+            "rows_scanned": self.rows,
+            "reference_ranges": reference_ranges(),
+            "markers": markers,
+            "by_signup_month": by_month,
+            "suppressed_signup_months": suppressed,
+            "min_group_size": min_group,
+        }
+
+
+def _to_arrays(rows):
+    user_ids = np.fromiter((r[0] for r in rows), dtype=np.int64, count=len(rows))
+    months = np.array([r[1] for r in rows], dtype="datetime64[M]")
+    # None → NaN
+    values = np.array([r[2:] for r in rows], dtype=float).reshape(len(rows), len(BIOMARKERS))
+    return user_ids, months, values
+
+
+def compute_lab_analytics(db: Session, chunk_size: int = LAB_ANALYTICS_CHUNK_SIZE):
+    acc = _Accumulator()
+    result = db.execute(LAB_ANALYTICS_SQL.execution_options(stream_results=True, yield_per=chunk_size))
+    carry = None  # last row of the previous chunk: its user may continue here
+
+    for rows in result.partitions(chunk_size):
+        acc.rows += len(rows)
+        if carry is not None:
+            rows = [carry] + list(rows)
+        user_ids, months, values = _to_arrays(rows)
+        # rows are ordered by user, then upload time: a user's latest row is
+        # the last one before the user id changes
+        latest = np.empty(len(rows), dtype=bool)
+        latest[:-1] = user_ids[:-1] != user_ids[1:]
+        latest[-1] = False
+        carry = rows[-1]
+        acc.add(months[latest], values[latest])
+
+    if carry is not None:
+        _, months, values = _to_arrays([carry])
+        acc.add(months, values)
+    return acc.report()
+
+
+def get_lab_analytics(db: Session):
+    global _cached
+    now = time.time()
+    with _lock:
+        if _cached is not None and now - _cached["built_at"] < LAB_ANALYTICS_TTL_SECONDS:
+            _stats["cache_hits"] += 1
+            return _cached
+
+    start = time.perf_counter()
+    report = compute_lab_analytics(db)
+    elapsed = time.perf_counter() - start
+
+    entry = {**report, "built_at": now}
+    with _lock:
+        _cached = entry
+        _stats["builds"] += 1
+        _stats["last_build_seconds"] = round(elapsed, 3)
+        _stats["last_rows_scanned"] = report["rows_scanned"]
+    return entry
+
+
+def stats():
+    with _lock:
+        return {**_stats, "ttl_seconds": LAB_ANALYTICS_TTL_SECONDS, "chunk_size": LAB_ANALYTICS_CHUNK_SIZE}
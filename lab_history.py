@@ -0,0 +1,112 @@
+import os
+from datetime import datetime
+
+from fastapi import Request
+from sqlalchemy.orm import Session
+
+from biomarkers import BIOMARKERS
+from crud import get_lab_history_rows
+from response_cache import UserCache, serialize
+
+# 📈 Per-user biomarker time series for GET /user/lab_results/history.
+# Each marker gets its points in upload order with the change from the
+# previous value, a trailing rolling average and an overall least-squares
+# slope. Built bodies are kept per (user, limit, window) until the user's
+# next lab upload/delete calls invalidate(user_id), or for at most the TTL
+# (a lab job finishing in another worker process doesn't reach this cache).
+LAB_HISTORY_MAX_POINTS = int(os.getenv("LAB_HISTORY_MAX_POINTS", "100"))
+LAB_HISTORY_CACHE_MAX_ENTRIES = int(os.getenv("LAB_HISTORY_CACHE_MAX_ENTRIES", "5000"))
+LAB_HISTORY_CACHE_TTL_SECONDS = int(os.getenv("LAB_HISTORY_CACHE_TTL_SECONDS", "300"))
+
+_cache = UserCache(LAB_HISTORY_CACHE_MAX_ENTRIES, LAB_HISTORY_CACHE_TTL_SECONDS)  # (user_id, limit, window) -> entry
+
+
+def _as_datetime(value):
+    # text() queries hand back strings on SQLite
+    if isinstance(value, str):
+        return datetime.fromisoformat(value)
+    return value
+
+
+def _slope_per_day(points):
+    # least squares over (days since first point, value)
+    if len(points) < 2:
+        return None
+    t0 = points[0][0]
+    xs = [(t - t0).total_seconds() / 86400 for t, _ in points]
+    ys = [v for _, v in points]
+    mean_x = sum(xs) / len(xs)
+    mean_y = sum(ys) / len(ys)
+    var_x = sum((x - mean_x) ** 2 for x in xs)
+    if var_x == 0:
+        return None
+    return sum((x - mean_x) * (y - mean_y) for x, y in zip(xs, ys)) / var_x
+
+
+def build_lab_history(rows, window: int):
+    # rows come newest first; the series run oldest → newest
+    rows = list(reversed(rows))
+    uploads = [
+        {"id": row.id, "filename": row.filename, "uploaded_at": _as_datetime(row.uploaded_at)}
+        for row in rows
+    ]
+
+    markers = {}
+    for m in BIOMARKERS:
+        series = []
+        values = []
+        timed = []
+        for row, upload in zip(rows, uploads):
+            value = getattr(row, m.column)
+            if value is None:
+                continue
+            previous = values[-1] if values else None
+            values.append(value)
+            recent = values[-window:]
+            if upload["uploaded_at"] is not None:
+                timed.append((upload["uploaded_at"], value))
+            series.append({
+                "lab_result_id": upload["id"],
+                "uploaded_at": upload["uploaded_at"].isoformat() if upload["uploaded_at"] else None,
+                "value": value,
+                "status": m.classify(value),
+                "delta": round(value - previous, 4) if previous is not None else None,
+                "rolling_avg": round(sum(recent) / len(recent), 4),
+            })
+
+        slope = _slope_per_day(timed)
+        markers[m.key] = {
+            "unit": m.unit,
+            "points": series,
+            "latest": values[-1] if values else None,
+            "change": round(values[-1] - values[0], 4) if len(values) > 1 else None,
+            "slope_per_30_days": round(slope * 30, 4) if slope is not None else None,
+        }
+
+    return {
+        "count": len(rows),
+        "window": window,
+        "first_uploaded_at": uploads[0]["uploaded_at"].isoformat() if uploads and uploads[0]["uploaded_at"] else None,
+        "last_uploaded_at": uploads[-1]["uploaded_at"].isoformat() if uploads and uploads[-1]["uploaded_at"] else None,
+        "markers": markers,
+    }
+
+
+def invalidate(user_id: int):
+    _cache.invalidate(user_id)
+
+
+def get_history_entry(db: Session, user_id: int, limit: int, window: int):
+    def build():
+        rows = get_lab_history_rows(db, user_id, limit)
+        return serialize({"user_id": user_id, **build_lab_history(rows, window)})
+
+    return _cache.get((user_id, limit, window), build)
+
+
+def history_response(request: Request, entry):
+    return _cache.response(request, entry)
+
+
+def stats():
+    return _cache.stats()
@@ -0,0 +1,362 @@
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import contextmanager
+
+# 🧬 Background lab extraction.
+# Uploads are written to disk and recorded as a job in a local SQLite file,
+# then a process pool runs extract_lab_values + classify_lab_results and
+# saves the LabResult row; the upload then becomes that row's lab_storage
+# blob. Jobs still queued (or cut off mid-run) when the server stops are
+# picked up again. A running job belongs to the server process that claimed
+# it and holds a lease that process keeps renewing; other processes (more
+# uvicorn workers, a rolling restart) only take a running job over once its
+# lease has expired. A worker that dies (OOM, a MuPDF crash) breaks the
+# pool: it is replaced, and the job that was running is retried until it
+# has had LAB_JOB_MAX_ATTEMPTS tries, then marked failed. The LabResult row
+# carries the job id, so a retried job never inserts a second row.
+LAB_JOBS_DB = os.getenv("LAB_JOBS_DB", "lab_jobs.sqlite3")
+LAB_JOBS_DIR = os.path.join("uploaded_lab_results", "jobs")
+# documents extracted at once; each may OCR up to lab_processing.OCR_WORKERS pages in parallel
+LAB_WORKERS = int(os.getenv("LAB_WORKERS", str(max(1, (os.cpu_count() or 2) // 2))))
+LAB_JOB_MAX_ATTEMPTS = int(os.getenv("LAB_JOB_MAX_ATTEMPTS", "3"))
+LAB_JOB_LEASE_SECONDS = int(os.getenv("LAB_JOB_LEASE_SECONDS", "60"))
+
+QUEUED, RUNNING, DONE, FAILED = "queued", "running", "done", "failed"
+
+_executor = None
+_executor_lock = threading.Lock()
+_on_done = None
+_pool_restarts = 0
+_owner = None  # "<host>:<pid>:<boot id>" of this server process once started
+_heartbeat_stop = None
+
+
+@contextmanager
+def _connect():
+    conn = sqlite3.connect(LAB_JOBS_DB, timeout=30)
+    conn.row_factory = sqlite3.Row
+    try:
+        with conn:
+            yield conn
+    finally:
+        conn.close()
+
+
+def init_store():
+    os.makedirs(LAB_JOBS_DIR, exist_ok=True)
+    with _connect() as conn:
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS lab_jobs (
+                id TEXT PRIMARY KEY,
+                user_id INTEGER NOT NULL,
+                filename TEXT NOT NULL,
+                file_path TEXT NOT NULL,
+                status TEXT NOT NULL,
+                result TEXT,
+                error TEXT,
+                lab_result_id INTEGER,
+                digest TEXT,
+                pages_total INTEGER,
+                pages_ocr INTEGER,
+                pages_skipped INTEGER,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                owner TEXT,
+                lease_expires REAL,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL
+            )
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS ix_lab_jobs_status ON lab_jobs (status, created_at)")
+        columns = {row["name"] for row in conn.execute("PRAGMA table_info(lab_jobs)")}
+        for name, kind in (("digest", "TEXT"), ("pages_total", "INTEGER"),
+                           ("pages_ocr", "INTEGER"), ("pages_skipped", "INTEGER"),
+                           ("owner", "TEXT"), ("lease_expires", "REAL")):
+            if name not in columns:
+                conn.execute(f"ALTER TABLE lab_jobs ADD COLUMN {name} {kind}")
+
+
+def _set_status(job_id: str, status: str, **fields):
+    fields["status"] = status
+    fields["updated_at"] = time.time()
+    assignments = ", ".join(f"{k} = ?" for k in fields)
+    with _connect() as conn:
+        conn.execute(f"UPDATE lab_jobs SET {assignments} WHERE id = ?", (*fields.values(), job_id))
+
+
+def _claim(job_id: str, owner: str):
+    # only one worker (across processes/restarts) gets to run a job
+    now = time.time()
+    with _connect() as conn:
+        cur = conn.execute(
+            "UPDATE lab_jobs SET status = ?, attempts = attempts + 1, owner = ?, lease_expires = ?, "
+            "updated_at = ? WHERE id = ? AND status = ?",
+            (RUNNING, owner, now + LAB_JOB_LEASE_SECONDS, now, job_id, QUEUED),
+        )
+        if cur.rowcount != 1:
+            return None
+        return conn.execute("SELECT * FROM lab_jobs WHERE id = ?", (job_id,)).fetchone()
+
+
+def _init_worker():
+    # connections inherited from the parent must not be reused after fork
+    from database import engine
+    engine.dispose(close=False)
+
+
+def run_job(job_id: str, owner: str):
+    # Runs inside a worker process
+    import extraction_cache
+    import lab_storage
+    from biomarkers import BIOMARKERS
+    from crud import create_lab_result
+    from database import SessionLocal
+    from lab_processing import EXTRACTOR_VERSION, classify_lab_results, extract_lab_values_with_stats
+    from models import LabResult
+
+    job = _claim(job_id, owner)
+    if job is None:
+        return None
+
+    db = SessionLocal()
+    try:
+        lab = db.query(LabResult).filter(LabResult.job_id == job_id).first()
+        if lab is None:
+            extracted, pages = extract_lab_values_with_stats(job["file_path"])
+            if job["digest"]:
+                extraction_cache.put(job["digest"], EXTRACTOR_VERSION, extracted)
+            lab = create_lab_result(
+                db, job["user_id"], job["filename"], extracted,
+                file_digest=job["digest"], file_size=os.path.getsize(job["file_path"]), job_id=job_id,
+            )
+        else:
+            # an earlier attempt saved the row and died before marking the job done
+            extracted = {m.key: getattr(lab, m.column) for m in BIOMARKERS}
+            pages = {"pages": None, "pages_ocr": None, "pages_skipped": None}
+        # the upload is kept as the row's blob (or dropped if an identical one exists)
+        if job["digest"] and os.path.exists(job["file_path"]):
+            try:
+                lab_storage.place_blob(job["file_path"], job["digest"])
+            except Exception:
+                # don't leave a row pointing at a blob that isn't there
+                db.delete(lab)
+                db.commit()
+                raise
+        result = {"data": extracted, "status": classify_lab_results(extracted)}
+        _set_status(
+            job_id, DONE, result=json.dumps(result), lab_result_id=lab.id,
+            pages_total=pages["pages"], pages_ocr=pages["pages_ocr"], pages_skipped=pages["pages_skipped"],
+        )
+    except Exception as e:
+        db.rollback()
+        print(f"❌ Lab job {job_id} failed: {e}")
+        _set_status(job_id, FAILED, error=str(e))
+    finally:
+        db.close()
+        if os.path.exists(job["file_path"]):
+            os.remove(job["file_path"])
+    return job["user_id"]
+
+
+def _new_executor():
+    return ProcessPoolExecutor(max_workers=LAB_WORKERS, initializer=_init_worker)
+
+
+def _replace_executor(broken):
+    # every future of a broken pool fails; only the first one swaps it out
+    global _executor, _pool_restarts
+    with _executor_lock:
+        if _executor is broken:
+            broken.shutdown(wait=False, cancel_futures=True)
+            _executor = _new_executor()
+            _pool_restarts += 1
+            print("⚠️ Lab worker process died, started a new pool")
+
+
+def _requeue_or_fail(conn, where: str, params=()):
+    # jobs cut off mid-run go back to the queue until they've used up their attempts;
+    # -> ids put back in the queue
+    now = time.time()
+    cut_off = conn.execute(
+        f"SELECT id, file_path, attempts FROM lab_jobs WHERE status = ? {where}", (RUNNING, *params)
+    ).fetchall()
+    requeued = []
+    for row in cut_off:
+        if row["attempts"] >= LAB_JOB_MAX_ATTEMPTS:
+            conn.execute(
+                "UPDATE lab_jobs SET status = ?, error = ?, owner = NULL, updated_at = ? WHERE id = ?",
+                (FAILED, f"Worker crashed on all {LAB_JOB_MAX_ATTEMPTS} attempts", now, row["id"]),
+            )
+            if row["file_path"] and os.path.exists(row["file_path"]):
+                os.remove(row["file_path"])
+        else:
+            conn.execute(
+                "UPDATE lab_jobs SET status = ?, owner = NULL, lease_expires = NULL, updated_at = ? WHERE id = ?",
+                (QUEUED, now, row["id"]),
+            )
+            requeued.append(row["id"])
+    return requeued
+
+
+def _reclaim_expired(conn):
+    # running jobs whose server process stopped renewing their lease
+    return _requeue_or_fail(conn, "AND (lease_expires IS NULL OR lease_expires < ?)", (time.time(),))
+
+
+def _heartbeat(stop):
+    while not stop.wait(LAB_JOB_LEASE_SECONDS / 3):
+        try:
+            with _connect() as conn:
+                conn.execute(
+                    "UPDATE lab_jobs SET lease_expires = ? WHERE status = ? AND owner = ?",
+                    (time.time() + LAB_JOB_LEASE_SECONDS, RUNNING, _owner),
+                )
+                requeued = _reclaim_expired(conn)
+            for job_id in requeued:
+                _submit(job_id)
+        except Exception as e:
+            print(f"❌ Lab job heartbeat failed: {e}")
+
+
+def _job_finished(job_id: str, executor, future):
+    if future.cancelled():
+        return
+    error = future.exception()
+    if isinstance(error, BrokenProcessPool):
+        _replace_executor(executor)
+        with _connect() as conn:
+            # only if it's still ours: never take over a job another process holds
+            _requeue_or_fail(conn, "AND id = ? AND owner = ?", (job_id, _owner))
+            status = conn.execute("SELECT status FROM lab_jobs WHERE id = ?", (job_id,)).fetchone()
+        # queued: either it never started or it gets another try
+        if status is not None and status["status"] == QUEUED:
+            _submit(job_id)
+        return
+    if _on_done is None or error is not None:
+        return
+    user_id = future.result()
+    if user_id is not None:
+        _on_done(user_id)
+
+
+def _submit(job_id: str):
+    with _executor_lock:
+        executor = _executor
+    if executor is None:
+        raise RuntimeError("Lab job workers are not running")
+    try:
+        future = executor.submit(run_job, job_id, _owner)
+    except BrokenProcessPool:
+        # a worker died since the last job finished
+        _replace_executor(executor)
+        with _executor_lock:
+            executor = _executor
+        future = executor.submit(run_job, job_id, _owner)
+    future.add_done_callback(lambda f: _job_finished(job_id, executor, f))
+
+
+def start(on_done=None):
+    # on_done(user_id) runs in this process once a job has written its row
+    global _executor, _on_done, _owner, _heartbeat_stop
+    init_store()
+    _on_done = on_done
+    _owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+    with _executor_lock:
+        _executor = _new_executor()
+
+    with _connect() as conn:
+        # a job left "running" with an expired lease means its process died under it;
+        # one with a live lease is still being run by another server process
+        _reclaim_expired(conn)
+        pending = [row["id"] for row in conn.execute(
+            "SELECT id FROM lab_jobs WHERE status = ? ORDER BY created_at", (QUEUED,)
+        )]
+    for job_id in pending:
+        _submit(job_id)
+    if pending:
+        print(f"🔁 Re-queued {len(pending)} lab extraction job(s)")
+
+    _heartbeat_stop = threading.Event()
+    threading.Thread(target=_heartbeat, args=(_heartbeat_stop,), daemon=True).start()
+
+
+def shutdown():
+    global _executor
+    if _heartbeat_stop is not None:
+        _heartbeat_stop.set()
+    with _executor_lock:
+        executor, _executor = _executor, None
+    if executor is not None:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+def new_job_path(filename: str):
+    job_id = uuid.uuid4().hex
+    return job_id, os.path.join(LAB_JOBS_DIR, job_id + os.path.splitext(filename)[1].lower())
+
+
+def enqueue(job_id: str, user_id: int, filename: str, file_path: str, digest: str | None = None):
+    now = time.time()
+    with _connect() as conn:
+        conn.execute(
+            "INSERT INTO lab_jobs (id, user_id, filename, file_path, digest, status, created_at, updated_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (job_id, user_id, filename, file_path, digest, QUEUED, now, now),
+        )
+    try:
+        _submit(job_id)
+    except Exception:
+        # no worker will ever pick it up: don't leave a queued row behind
+        with _connect() as conn:
+            conn.execute("DELETE FROM lab_jobs WHERE id = ?", (job_id,))
+        raise
+    return job_id
+
+
+def record_done(job_id: str, user_id: int, filename: str, digest: str, result: dict, lab_result_id: int):
+    # for uploads answered from the extraction cache: no worker involved,
+    # but the job still exists so polling behaves the same
+    now = time.time()
+    with _connect() as conn:
+        conn.execute(
+            "INSERT INTO lab_jobs (id, user_id, filename, file_path, digest, status, result, "
+            "lab_result_id, created_at, updated_at) VALUES (?, ?, ?, '', ?, ?, ?, ?, ?, ?)",
+            (job_id, user_id, filename, digest, DONE, json.dumps(result), lab_result_id, now, now),
+        )
+    return job_id
+
+
+def get_job(job_id: str):
+    with _connect() as conn:
+        row = conn.execute("SELECT * FROM lab_jobs WHERE id = ?", (job_id,)).fetchone()
+    if row is None:
+        return None
+    job = dict(row)
+    job["result"] = json.loads(job["result"]) if job["result"] else None
+    return job
+
+
+def stats():
+    with _connect() as conn:
+        counts = dict(conn.execute("SELECT status, COUNT(*) FROM lab_jobs GROUP BY status").fetchall())
+        pages = conn.execute(
+            "SELECT COALESCE(SUM(pages_total), 0), COALESCE(SUM(pages_ocr), 0), COALESCE(SUM(pages_skipped), 0) "
+            "FROM lab_jobs WHERE pages_total IS NOT NULL"
+        ).fetchone()
+    return {
+        "workers": LAB_WORKERS,
+        "pool_restarts": _pool_restarts,
+        "max_attempts": LAB_JOB_MAX_ATTEMPTS,
+        **{s: counts.get(s, 0) for s in (QUEUED, RUNNING, DONE, FAILED)},
+        # early exit: pages never opened because every biomarker was already found
+        "pages_total": pages[0],
+        "pages_ocr": pages[1],
+        "pages_skipped": pages[2],
+    }
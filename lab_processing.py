@@ -0,0 +1,174 @@
+# 🧬 Lab result helpers
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import fitz  # PyMuPDF
+import pytesseract
+from pdf2image import convert_from_path
+from PIL import Image
+
+from biomarkers import BIOMARKERS, BiomarkerScanner, match_biomarkers
+from lab_jobs import LAB_WORKERS
+
+# Scanned PDFs are OCR'd page by page in parallel. pdftoppm and tesseract are
+# separate processes, so threads are enough to keep every core busy, and
+# each page is only rasterized when a worker picks it up.
+# OCR_WORKERS is per document, and up to LAB_WORKERS documents are extracted
+# at once, so at most LAB_WORKERS × OCR_WORKERS pdftoppm/tesseract pairs run
+# together. The default splits the cores between the jobs instead of giving
+# every job all of them.
+OCR_WORKERS = int(os.getenv("OCR_WORKERS", str(max(1, (os.cpu_count() or 1) // LAB_WORKERS))))
+OCR_DPI = int(os.getenv("OCR_DPI", "200"))
+
+# Read PDFs page by page and stop once every biomarker is found. As in the
+# full read, a document with less text than this in total is a scan; only
+# then are its pages without a text layer (images, no text) OCR'd
+STREAMING_EXTRACTION = os.getenv("LAB_STREAMING_EXTRACTION", "1") != "0"
+MIN_PAGE_TEXT_CHARS = 50
+
+# bump whenever extraction output can change (patterns, OCR settings) so the
+# extraction cache doesn't serve results from the old extractor
+EXTRACTOR_VERSION = "4"
+
+
+def ocr_pdf_page(file_path: str, page_number: int, dpi: int = OCR_DPI):
+    images = convert_from_path(file_path, dpi=dpi, first_page=page_number, last_page=page_number)
+    return "".join(pytesseract.image_to_string(img) for img in images)
+
+
+def ocr_pdf(file_path: str, page_count: int, workers: int = OCR_WORKERS, dpi: int = OCR_DPI):
+    pages = range(1, page_count + 1)
+    if workers <= 1 or page_count <= 1:
+        return "".join(ocr_pdf_page(file_path, n, dpi) for n in pages)
+    with ThreadPoolExecutor(max_workers=min(workers, page_count)) as pool:
+        return "".join(pool.map(lambda n: ocr_pdf_page(file_path, n, dpi), pages))
+
+
+# 🧠 Utility function – Extract biomarkers
+def extract_lab_values(file_path: str):
+    return extract_lab_values_with_stats(file_path)[0]
+
+
+def extract_lab_values_with_stats(file_path: str, streaming: bool = STREAMING_EXTRACTION):
+    # -> (extracted values, {"pages", "pages_read", "pages_ocr", "pages_skipped"})
+    if not file_path.lower().endswith(".pdf"):
+        # If image
+        print("🟡 Image detected — using OCR...")
+        img = Image.open(file_path)
+        text = pytesseract.image_to_string(img)
+        _print_text(text)
+        return match_biomarkers(text), {"pages": 1, "pages_read": 1, "pages_ocr": 1, "pages_skipped": 0}
+
+    if streaming:
+        return _extract_pdf_streaming(file_path)
+    return _extract_pdf_full(file_path)
+
+
+def _print_text(text: str):
+    print("\n================ EXTRACTED TEXT ================\n")
+    print(text)
+    print("\n===============================================\n")
+
+
+def _extract_pdf_full(file_path: str):
+    # Whole document first, OCR decided for the document as a whole
+    text = ""
+    doc = fitz.open(file_path)
+    for page in doc:
+        text += page.get_text("text") + "\n"
+    page_count = doc.page_count
+    doc.close()
+
+    ocr_pages = 0
+    # If scanned (no text) → OCR
+    if len(text.strip()) < MIN_PAGE_TEXT_CHARS:
+        print("🟡 Scanned PDF detected — using OCR...")
+        text += ocr_pdf(file_path, page_count)
+        ocr_pages = page_count
+    else:
+        print("🟢 Text-based PDF detected — no OCR needed.")
+
+    _print_text(text)
+    stats = {"pages": page_count, "pages_read": page_count, "pages_ocr": ocr_pages, "pages_skipped": 0}
+    return match_biomarkers(text), stats
+
+
+def _is_scanned_page(page, page_text: str):
+    return not page_text.strip() and bool(page.get_images())
+
+
+def _extract_pdf_streaming(file_path: str):
+    # Page by page, in order, stopping once every registered marker has a
+    # value. In a scanned document, pages without a text layer are OCR'd, a
+    # run of up to OCR_WORKERS consecutive scanned pages at a time.
+    scanner = BiomarkerScanner()
+    texts = []
+    read = ocr = 0
+
+    with fitz.open(file_path) as doc:
+        page_count = doc.page_count
+        scanned_doc = None
+
+        def needs_ocr(n: int, page_text: str):
+            nonlocal scanned_doc
+            if not _is_scanned_page(doc[n], page_text):
+                return False
+            if scanned_doc is None:
+                # same document-level test as the full read, done once and
+                # only when an image-only page turns up (text layers are cheap)
+                text_chars = sum(len(p.get_text("text").strip()) for p in doc)
+                scanned_doc = text_chars < MIN_PAGE_TEXT_CHARS
+            return scanned_doc
+
+        pool = ThreadPoolExecutor(max_workers=OCR_WORKERS) if OCR_WORKERS > 1 else None
+        try:
+            page = 0
+            while page < page_count and not scanner.complete:
+                page_text = doc[page].get_text("text")
+                if not needs_ocr(page, page_text):
+                    texts.append(page_text)
+                    scanner.feed(page_text)
+                    read += 1
+                    page += 1
+                    continue
+
+                batch = [page]
+                while (
+                    len(batch) < OCR_WORKERS
+                    and batch[-1] + 1 < page_count
+                    and needs_ocr(batch[-1] + 1, doc[batch[-1] + 1].get_text("text"))
+                ):
+                    batch.append(batch[-1] + 1)
+                print(f"🟡 OCR for page(s) {batch[0] + 1}-{batch[-1] + 1}...")
+
+                if pool is not None:
+                    ocr_texts = list(pool.map(lambda n: ocr_pdf_page(file_path, n + 1), batch))
+                else:
+                    ocr_texts = [ocr_pdf_page(file_path, n + 1) for n in batch]
+                for page_text in ocr_texts:
+                    texts.append(page_text)
+                    if scanner.feed(page_text):
+                        break
+                # every page in the batch was rendered and OCR'd, even if the
+                # scanner completed before all of them were fed to it
+                read += len(batch)
+                ocr += len(batch)
+                page = batch[-1] + 1
+        finally:
+            if pool is not None:
+                pool.shutdown()
+
+    stats = {"pages": page_count, "pages_read": read, "pages_ocr": ocr, "pages_skipped": page_count - read}
+    print(f"🟢 Read {read}/{page_count} page(s), OCR on {ocr}, skipped {stats['pages_skipped']}")
+    _print_text("\n".join(texts))
+    return scanner.result(), stats
+
+
+def classify_lab_results(data):
+    # e.g. {"LDL_status": "High", "HDL_status": "Healthy"}; bands live in biomarkers.py
+    result = {}
+    for marker in BIOMARKERS:
+        value = data.get(marker.key)
+        if isinstance(value, (int, float)):
+            result[f"{marker.key}_status"] = marker.classify(value)
+    return result
@@ -0,0 +1,149 @@
+import mimetypes
+import os
+import threading
+import uuid
+from contextlib import contextmanager
+from email.utils import parsedate_to_datetime
+
+from fastapi import HTTPException, Request, Response
+from fastapi.responses import FileResponse
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from response_cache import etag_matches
+
+try:
+    import fcntl
+except ImportError:  # Windows: in-process lock only
+    fcntl = None
+
+# 🗄️ Content-addressed lab file storage
+# Uploaded files live once per content hash under sharded paths
+# (blobs/ab/cd/<sha256>); LabResult.file_digest rows are the references.
+# A new blob is moved into place only after the row pointing at it is
+# committed, and a blob is deleted only when no row points at it any more —
+# both under one lock shared by the API and the lab worker processes, so a
+# delete can't race an upload of the same file.
+LAB_BLOB_DIR = os.getenv("LAB_BLOB_DIR", os.path.join("uploaded_lab_results", "blobs"))
+LAB_BLOB_TMP_DIR = os.path.join(LAB_BLOB_DIR, "tmp")
+# files saved before content addressing: uploaded_lab_results/user_{id}_{filename}
+LEGACY_UPLOAD_DIR = "uploaded_lab_results"
+
+os.makedirs(LAB_BLOB_TMP_DIR, exist_ok=True)
+
+_lock = threading.Lock()  # stats
+_blob_thread_lock = threading.Lock()  # threads in this process; flock covers other processes
+_stats = {"stored": 0, "deduplicated": 0, "reclaimed": 0, "bytes_reclaimed": 0, "not_modified": 0}
+
+
+def blob_path(digest: str):
+    return os.path.join(LAB_BLOB_DIR, digest[:2], digest[2:4], digest)
+
+
+def new_temp_path():
+    # same filesystem as the blobs, so placing one is a rename
+    return os.path.join(LAB_BLOB_TMP_DIR, uuid.uuid4().hex)
+
+
+@contextmanager
+def _blob_lock():
+    with _blob_thread_lock:
+        if fcntl is None:
+            yield
+            return
+        with open(os.path.join(LAB_BLOB_DIR, ".lock"), "a") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def place_blob(temp_path: str, digest: str):
+    # call once the LabResult row with this digest is committed;
+    # the temp file is consumed either way
+    path = blob_path(digest)
+    with _blob_lock():
+        if os.path.exists(path):
+            os.remove(temp_path)
+            key = "deduplicated"
+        else:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            os.replace(temp_path, path)
+            key = "stored"
+    with _lock:
+        _stats[key] += 1
+    return path
+
+
+def reference_count(db: Session, digest: str):
+    return db.execute(
+        text("SELECT COUNT(*) FROM lab_results WHERE file_digest = :digest"),
+        {"digest": digest},
+    ).scalar()
+
+
+def release(db: Session, digest: str):
+    # call after the delete of a referencing row is committed
+    path = blob_path(digest)
+    with _blob_lock():
+        if reference_count(db, digest) > 0 or not os.path.exists(path):
+            return False
+        size = os.path.getsize(path)
+        os.remove(path)
+        # drop the shard directories once they're empty
+        for shard in (os.path.dirname(path), os.path.dirname(os.path.dirname(path))):
+            try:
+                os.rmdir(shard)
+            except OSError:
+                break
+    with _lock:
+        _stats["reclaimed"] += 1
+        _stats["bytes_reclaimed"] += size
+    return True
+
+
+def lab_file_path(lab):
+    if lab.file_digest:
+        return blob_path(lab.file_digest)
+    return os.path.join(LEGACY_UPLOAD_DIR, f"user_{lab.user_id}_{lab.filename}")
+
+
+def _not_modified_since(request: Request, path: str):
+    header = request.headers.get("if-modified-since")
+    if not header or "if-none-match" in request.headers:
+        return False
+    try:
+        since = parsedate_to_datetime(header).timestamp()
+    except (TypeError, ValueError):
+        return False
+    return int(os.stat(path).st_mtime) <= since
+
+
+def file_response(request: Request, lab):
+    # FileResponse handles Range/If-Range and hands the path to the server
+    # via the ASGI pathsend extension when it supports it
+    path = lab_file_path(lab)
+    if not os.path.isfile(path):
+        raise HTTPException(status_code=404, detail="File not found")
+
+    headers = {}
+    if lab.file_digest:
+        # content-addressed: the digest is a strong ETag and the bytes never change
+        headers["ETag"] = f'"{lab.file_digest}"'
+        headers["Cache-Control"] = "private, max-age=31536000, immutable"
+    else:
+        headers["Cache-Control"] = "private, no-cache"
+
+    if (lab.file_digest and etag_matches(request, headers["ETag"])) or _not_modified_since(request, path):
+        with _lock:
+            _stats["not_modified"] += 1
+        return Response(status_code=304, headers=headers)
+
+    media_type = mimetypes.guess_type(lab.filename)[0] or "application/octet-stream"
+    return FileResponse(path, media_type=media_type, filename=lab.filename, headers=headers)
+
+
+def stats():
+    with _lock:
+        return dict(_stats)
@@ -0,0 +1,100 @@
+import hashlib
+import io
+import json
+import os
+
+from starlette.staticfiles import StaticFiles
+
+# Logos are shown at 48px in the app. At startup each PNG in static/logos is
+# resized to 1x/2x/3x (never upscaled), written as PNG + WebP under a
+# content-hashed name, and served from /assets/logos as immutable.
+LOGO_DIR = os.path.join("static", "logos")
+LOGO_BUILD_DIR = os.path.join(LOGO_DIR, "build")
+LOGO_ASSET_PREFIX = "/assets/logos"
+LOGO_DISPLAY_PX = 48
+LOGO_SCALES = (1, 2, 3)
+# bump when sizes/encoders change so clients pick up the new files
+LOGO_PIPELINE_VERSION = "1"
+
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+# "egg.png" -> {"png": {"1x": "egg.<hash>.48.png", ...}, "webp": {...}}
+_manifest = {}
+
+
+class ImmutableStaticFiles(StaticFiles):
+    # file names change with content, so clients never need to revalidate
+    def file_response(self, *args, **kwargs):
+        response = super().file_response(*args, **kwargs)
+        response.headers["Cache-Control"] = IMMUTABLE_CACHE_CONTROL
+        return response
+
+
+def build_logo_assets(src_dir: str = LOGO_DIR, out_dir: str = LOGO_BUILD_DIR):
+    os.makedirs(out_dir, exist_ok=True)
+    try:
+        from PIL import Image
+    except ImportError:
+        print("⚠️ Pillow not installed — serving original logos")
+        return _manifest
+
+    manifest = {}
+    for fname in sorted(os.listdir(src_dir)):
+        if not fname.lower().endswith(".png"):
+            continue
+
+        with open(os.path.join(src_dir, fname), "rb") as f:
+            data = f.read()
+        digest = hashlib.sha256(data + LOGO_PIPELINE_VERSION.encode()).hexdigest()[:10]
+        stem = os.path.splitext(fname)[0]
+        img = Image.open(io.BytesIO(data)).convert("RGBA")
+
+        variants = {"png": {}, "webp": {}}
+        for scale in LOGO_SCALES:
+            px = min(LOGO_DISPLAY_PX * scale, max(img.size))
+            resized = None
+            for fmt, ext in (("PNG", "png"), ("WEBP", "webp")):
+                out_name = f"{stem}.{digest}.{px}.{ext}"
+                out_path = os.path.join(out_dir, out_name)
+                if not os.path.exists(out_path):
+                    if resized is None:
+                        resized = img.copy()
+                        resized.thumbnail((px, px), Image.LANCZOS)
+                    if fmt == "PNG":
+                        resized.save(out_path, fmt, optimize=True)
+                    else:
+                        resized.save(out_path, fmt, quality=90, method=6)
+                variants[ext][f"{scale}x"] = out_name
+        manifest[fname] = variants
+
+    with open(os.path.join(out_dir, "manifest.json"), "w") as f:
+        json.dump(manifest, f, indent=2)
+
+    _manifest.clear()
+    _manifest.update(manifest)
+    print(f"🖼️ Built logo variants for {len(manifest)} logos")
+    return _manifest
+
+
+def logo_url(base_url: str, logo_path: str | None):
+    if not logo_path:
+        return None
+    variants = _manifest.get(logo_path)
+    if not variants:
+        return f"{base_url}/static/logos/{logo_path}"
+    largest = f"{LOGO_SCALES[-1]}x"
+    return f"{base_url}{LOGO_ASSET_PREFIX}/{variants['png'][largest]}"
+
+
+def logo_variants(base_url: str, logo_path: str | None):
+    variants = _manifest.get(logo_path) if logo_path else None
+    if not variants:
+        return None
+    return {
+        fmt: {scale: f"{base_url}{LOGO_ASSET_PREFIX}/{name}" for scale, name in by_scale.items()}
+        for fmt, by_scale in variants.items()
+    }
+
+
+if __name__ == "__main__":
+    build_logo_assets()
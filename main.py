@@ -2,64 +2,89 @@ from urllib import request
 from fastapi import FastAPI, Depends, HTTPException, status
 from sqlalchemy.orm import Session
 from database import Base, engine, SessionLocal
-from schemas import UserCreate, UserLogin, UserResponse, DietaryRestrictionBase,UserServingSelection
-from crud import create_user, get_user_by_email, verify_password, get_all_dietary_restrictions,save_user_serving
-from jose import JWTError, jwt
+from schemas import UserCreate, UserLogin, UserResponse, DietaryRestrictionBase,UserServingSelection, OnboardingSubmission
+from crud import save_user_serving, replace_user_serving
 from datetime import datetime, timedelta
 from typing import List  # ✅ add this line
 from models import User, DietaryRestriction,Serving,UserServing
 from fastapi.staticfiles import StaticFiles
 from fastapi import Request
-from database import get_db
+from database import get_db, get_async_db, async_engine
+from sqlalchemy.ext.asyncio import AsyncSession
+from crud import get_user_by_email_async, create_user_async
 from sqlalchemy import text  # ✅ add this import at the top if missing
+from logo_assets import ImmutableStaticFiles, build_logo_assets, logo_url, LOGO_ASSET_PREFIX, LOGO_BUILD_DIR
 app = FastAPI()
+build_logo_assets()
+app.mount(LOGO_ASSET_PREFIX, ImmutableStaticFiles(directory=LOGO_BUILD_DIR), name="logo_assets")
 app.mount("/static", StaticFiles(directory="static"), name="static")
-from fastapi.security import HTTPBearer
-from fastapi import Security
 from models import SavedRecipe
-from schemas import SaveRecipeRequest
+from crud import get_saved_recipes_page, get_saved_recipe, get_saved_recipe_summaries, create_saved_recipes, recipe_summary
+import ingredient_index
+from ingredient_index import decode_recipe_list
+from response_cache import serialize
+from pagination import encode_cursor, decode_cursor
+from fastapi import Response
+from typing import Optional
+from schemas import SaveRecipeRequest, CurrentUser
+from auth import create_access_token, get_current_user, token_cache
+import hashing
+from hashing import hash_password_async, verify_password_async
+from fastapi.concurrency import run_in_threadpool
+import catalog_cache
+from catalog_cache import catalog_response
+import profile_cache
+from profile_cache import get_profile_entry, profile_response, iter_user_profiles
+from schemas import UserInfoBatchRequest
+from fastapi.responses import StreamingResponse
 import json
 
-security = HTTPBearer(auto_error=False)
-
 import os
 print("📁 Current working directory:", os.getcwd())
 print("📂 Static folder absolute path:", os.path.abspath("static"))
 
 Base.metadata.create_all(bind=engine)
 
-SECRET_KEY = "mysecretkey"  # change to something secure
-ALGORITHM = "HS256"
-ACCESS_TOKEN_EXPIRE_MINUTES = 60
-
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
-
+# create_all skips tables that already exist, so nullable columns and
+# indexes added to a model later are created here
+from sqlalchemy import inspect as sa_inspect
+_inspector = sa_inspect(engine)
+for table in Base.metadata.sorted_tables:
+    existing = {c["name"] for c in _inspector.get_columns(table.name)}
+    for column in table.columns:
+        if column.name not in existing and column.nullable:
+            with engine.begin() as conn:
+                conn.execute(text(
+                    f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column.type.compile(engine.dialect)}"
+                ))
+    for index in table.indexes:
+        index.create(bind=engine, checkfirst=True)
+
+@app.on_event("shutdown")
+def shutdown_hashing_pool():
+    hashing.shutdown()
+
+@app.on_event("shutdown")
+async def dispose_async_engine():
+    await async_engine.dispose()
+
+# 🔐 bcrypt runs in the hashing process pool; DB calls go through the async session
 @app.post("/signup", response_model=UserResponse)
-def signup(user: UserCreate, db: Session = Depends(get_db)):
-    existing_user = get_user_by_email(db, user.email)
-    print("PASSWORD:", user.password)
-    print("PASSWORD LENGTH:", len(user.password))
+async def signup(user: UserCreate, db: AsyncSession = Depends(get_async_db)):
+    existing_user = await get_user_by_email_async(db, user.email)
     if existing_user:
         raise HTTPException(status_code=400, detail="Email already registered")
-    new_user = create_user(db, user.full_name, user.email, user.password)
+    hashed_password = await hash_password_async(user.password)
+    new_user = await create_user_async(db, user.full_name, user.email, hashed_password)
     return new_user
 
 @app.post("/login")
-def login(request: UserLogin, db: Session = Depends(get_db)):
-    user = get_user_by_email(db, request.email)
-    if not user or not verify_password(request.password, user.password):
+async def login(request: UserLogin, db: AsyncSession = Depends(get_async_db)):
+    user = await get_user_by_email_async(db, request.email)
+    if not user or not await verify_password_async(request.password, user.password):
         raise HTTPException(status_code=401, detail="Invalid email or password")
     
-    token_data = {
-        "sub": user.email,
-        "exp": datetime.utcnow() + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
-    }
-    access_token = jwt.encode(token_data, SECRET_KEY, algorithm=ALGORITHM)
+    access_token = create_access_token(user)
     return {"access_token": access_token, "token_type": "bearer","onboarding_completed": user.onboarding_completed,"user_id": user.id,"onboarding_step": user.onboarding_step,  }
 
 @app.put("/user/{user_id}/complete_onboarding")
@@ -76,32 +101,18 @@ def complete_onboarding(user_id: int, db: Session = Depends(get_db)):
 
 @app.get("/dietary_restrictions", response_model=List[DietaryRestrictionBase])
 def get_dietary_restrictions(request: Request, db: Session = Depends(get_db)):
-    restrictions = get_all_dietary_restrictions(db)
-    base_url = str(request.base_url).rstrip('/')
-    for r in restrictions:
-        if r.logo_path:
-            r.logo_path = f"{base_url}/static/logos/{r.logo_path}"
-    return restrictions
+    return catalog_response("dietary_restrictions", request, db)
+
+
+# 🚀 All onboarding catalogs in one round trip (cold-start bootstrap)
+@app.get("/catalog")
+def get_catalog(request: Request, db: Session = Depends(get_db)):
+    return catalog_response(catalog_cache.COMBINED, request, db)
 
 
 from schemas import UserDietarySelection
-from crud import save_user_dietary_restrictions
-from jose import jwt, JWTError
+from crud import save_user_dietary_restrictions, add_user_dietary_restrictions
 
-# ✅ Helper function to extract user ID from token
-def get_current_user_id(token: str = Depends(lambda: None), db: Session = Depends(get_db)):
-    if token is None:
-        raise HTTPException(status_code=401, detail="Missing token")
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        email = payload.get("sub")
-        user = db.query(User).filter(User.email == email).first()
-        if not user:
-            raise HTTPException(status_code=401, detail="Invalid user")
-        return user.id
-    except JWTError:
-        raise HTTPException(status_code=401, detail="Invalid token")
-        
 
 from sqlalchemy import text
 
@@ -109,29 +120,17 @@ from sqlalchemy import text
 def set_user_dietary_restrictions(
     selection: UserDietarySelection,
     db: Session = Depends(get_db),
-    credentials: dict = Security(security)
+    current_user: CurrentUser = Depends(get_current_user)
 ):
-    if not credentials:
-        raise HTTPException(status_code=401, detail="Missing token")
-
-    token = credentials.credentials
     try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        email = payload.get("sub")
-        user = db.query(User).filter(User.email == email).first()
-        if not user:
-            raise HTTPException(status_code=404, detail="User not found")
-
-        print(f"✅ User ID: {user.id}")
+        print(f"✅ User ID: {current_user.id}")
         print(f"✅ Dietary IDs: {selection.dietary_ids}")
 
-        for dietary_id in selection.dietary_ids:
-            db.execute(
-                text("INSERT INTO user_dietary_restrictions (user_id, dietary_id) VALUES (:user_id, :dietary_id)"),
-                {"user_id": user.id, "dietary_id": dietary_id},
-            )
-        user.onboarding_step = 2
+        # ✅ One multi-row insert; ids already saved are skipped, so retries are safe
+        add_user_dietary_restrictions(db, current_user.id, selection.dietary_ids)
+        db.query(User).filter(User.id == current_user.id).update({"onboarding_step": 2})
         db.commit()
+        profile_cache.invalidate(current_user.id)
         print("✅ Commit successful.")
         return {"message": "Dietary restrictions saved successfully"}
 
@@ -141,48 +140,42 @@ def set_user_dietary_restrictions(
         raise HTTPException(status_code=500, detail=str(e))
 
 
+# 🔁 Replace the whole diet selection (profile edit screen); only the diff is written
+@app.put("/user/dietary_restrictions")
+def replace_user_dietary_restrictions(
+    selection: UserDietarySelection,
+    db: Session = Depends(get_db),
+    current_user: CurrentUser = Depends(get_current_user)
+):
+    result = save_user_dietary_restrictions(db, current_user.id, selection.dietary_ids)
+    if result["changed"]:
+        profile_cache.invalidate(current_user.id)
+    return result
+
+
 from schemas import AllergyBase
-from crud import get_all_allergies
 
 @app.get("/allergies", response_model=List[AllergyBase])
 def get_all_allergies_endpoint(request: Request, db: Session = Depends(get_db)):
-    allergies = get_all_allergies(db)
-    base_url = str(request.base_url).rstrip('/')
-    for a in allergies:
-        if a.logo_path:
-            a.logo_path = f"{base_url}/static/logos/{a.logo_path}"
-    return allergies
+    return catalog_response("allergies", request, db)
 
 from schemas import UserAllergySelection
-from crud import save_user_allergies
+from crud import save_user_allergies, add_user_allergies
 
 @app.post("/user/allergies")
 def set_user_allergies(
     selection: UserAllergySelection,
     db: Session = Depends(get_db),
-    credentials: dict = Security(security)
+    current_user: CurrentUser = Depends(get_current_user)
 ):
-    if not credentials:
-        raise HTTPException(status_code=401, detail="Missing token")
-
-    token = credentials.credentials
     try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        email = payload.get("sub")
-        user = db.query(User).filter(User.email == email).first()
-        if not user:
-            raise HTTPException(status_code=404, detail="User not found")
-
-        print(f"✅ User ID: {user.id}")
+        print(f"✅ User ID: {current_user.id}")
         print(f"✅ Allergies IDs: {selection.allergy_ids}")
 
-        for allergy_id in selection.allergy_ids:
-            db.execute(
-                text("INSERT INTO user_allergies (user_id, allergy_id) VALUES (:user_id, :allergy_id)"),
-                {"user_id": user.id, "allergy_id": allergy_id},
-            )
-        user.onboarding_step = 3
+        add_user_allergies(db, current_user.id, selection.allergy_ids)
+        db.query(User).filter(User.id == current_user.id).update({"onboarding_step": 3})
         db.commit()
+        profile_cache.invalidate(current_user.id)
         print("✅ Commit successful.")
         return {"message": "Allergies saved successfully"}
 
@@ -191,39 +184,31 @@ def set_user_allergies(
         print(f"❌ Error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+# 🔁 Replace the whole allergy selection; only the diff is written
+@app.put("/user/allergies")
+def replace_user_allergies(
+    selection: UserAllergySelection,
+    db: Session = Depends(get_db),
+    current_user: CurrentUser = Depends(get_current_user)
+):
+    result = save_user_allergies(db, current_user.id, selection.allergy_ids)
+    if result["changed"]:
+        profile_cache.invalidate(current_user.id)
+    return result
+
 from schemas import ServingBase
-from crud import get_all_servings
 
 @app.get("/servings", response_model=List[ServingBase])
 def get_all_servings_endpoint(request: Request, db: Session = Depends(get_db)):
-    servings = get_all_servings(db)
-    base_url = str(request.base_url).rstrip('/')
-    for s in servings:
-        if s.logo_path:
-            s.logo_path = f"{base_url}/static/logos/{s.logo_path}"
-    return servings
+    return catalog_response("servings", request, db)
 
-@app.post("/user/servings")
-def set_user_servings(
-    selection: UserServingSelection,
-    db: Session = Depends(get_db),
-    credentials: dict = Security(security)
-):
-    if not credentials:
-        raise HTTPException(status_code=401, detail="Missing token")
-
-    token = credentials.credentials
-    payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-    email = payload.get("sub")
-    user = db.query(User).filter(User.email == email).first()
-    if not user:
-        raise HTTPException(status_code=404, detail="User not found")
-
-    family_count = selection.family_count
+# 🔹 Default family_count from the serving type ("Just me" = 1, "Couple" = 2)
+def resolve_family_count(db: Session, selection: UserServingSelection):
     serving = db.query(Serving).filter(Serving.id == selection.serving_id).first()
     if not serving:
         raise HTTPException(status_code=404, detail="Invalid serving_id")
 
+    family_count = selection.family_count
     if family_count is None:
         if "just" in serving.name.lower():
             family_count = 1
@@ -231,63 +216,124 @@ def set_user_servings(
             family_count = 2
         elif "family" in serving.name.lower():
             raise HTTPException(status_code=400, detail="Family count required")
+    return family_count
 
-    save_user_serving(db, user.id, selection.serving_id, family_count)
-    user.onboarding_step = 4
+@app.post("/user/servings")
+def set_user_servings(
+    selection: UserServingSelection,
+    db: Session = Depends(get_db),
+    current_user: CurrentUser = Depends(get_current_user)
+):
+    family_count = resolve_family_count(db, selection)
+
+    save_user_serving(db, current_user.id, selection.serving_id, family_count)
+    db.query(User).filter(User.id == current_user.id).update({"onboarding_step": 4})
     db.commit()
+    profile_cache.invalidate(current_user.id)
     return {"message": "Serving preference saved successfully"}
 
 
+# ===============================================
+# 🚀 ONE-SHOT ONBOARDING SUBMIT
+# ===============================================
+@app.post("/onboarding")
+def submit_onboarding(
+    submission: OnboardingSubmission,
+    db: Session = Depends(get_db),
+    current_user: CurrentUser = Depends(get_current_user)
+):
+    # ✅ Diets, allergies, serving and progress flag in a single commit
+    try:
+        add_user_dietary_restrictions(db, current_user.id, submission.dietary_ids)
+        add_user_allergies(db, current_user.id, submission.allergy_ids)
+
+        step = 3
+        if submission.serving:
+            family_count = resolve_family_count(db, submission.serving)
+            replace_user_serving(db, current_user.id, submission.serving.serving_id, family_count)
+            step = 4
+
+        values = {"onboarding_step": step}
+        if submission.complete:
+            values = {"onboarding_step": 5, "onboarding_completed": True}
+        db.query(User).filter(User.id == current_user.id).update(values)
+
+        db.commit()
+        profile_cache.invalidate(current_user.id)
+        return {"message": "Onboarding saved successfully", **values}
+
+    except HTTPException:
+        db.rollback()
+        raise
+    except Exception as e:
+        db.rollback()
+        print(f"❌ Error: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
 # ===============================================
 # 🧬 LAB RESULTS UPLOAD ENDPOINT
 # ===============================================
-from fastapi import UploadFile, File
+from fastapi import UploadFile, File, Query
 from models import LabResult
+from uploads import UploadLimitMiddleware, save_upload, discard
+import lab_storage
 import os
 
 UPLOAD_DIR = "uploaded_lab_results"
 os.makedirs(UPLOAD_DIR, exist_ok=True)
 
+import lab_history
+
+# 📦 Upload size limit, enforced before the multipart body is parsed
+app.add_middleware(UploadLimitMiddleware, paths=["/upload_lab_result", "/upload_lab_result_extract"])
+
+# ✅ Every lab write drops the user's cached profile and history
+def lab_results_changed(user_id: int):
+    profile_cache.invalidate(user_id)
+    lab_history.invalidate(user_id)
+
+# 🗄️ The row is committed before its blob is moved into place; if the move
+# fails, the row is taken back so it never points at a missing file
+async def place_lab_blob(db: AsyncSession, lab: LabResult, temp_path: str, digest: str):
+    try:
+        await run_in_threadpool(lab_storage.place_blob, temp_path, digest)
+    except Exception:
+        await db.delete(lab)
+        await db.commit()
+        raise
+
 @app.post("/upload_lab_result")
 async def upload_lab_result(
     file: UploadFile = File(...),
-    db: Session = Depends(get_db),
-    credentials: dict = Security(security)
+    db: AsyncSession = Depends(get_async_db),
+    current_user: CurrentUser = Depends(get_current_user)
 ):
-    # ✅ Check token
-    if not credentials:
-        raise HTTPException(status_code=401, detail="Missing token")
-
-    token = credentials.credentials
+    temp_path = lab_storage.new_temp_path()
     try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        email = payload.get("sub")
-        user = db.query(User).filter(User.email == email).first()
-        if not user:
-            raise HTTPException(status_code=404, detail="User not found")
-
         # ✅ Only allow PDF
         if not file.filename.lower().endswith(".pdf"):
             raise HTTPException(status_code=400, detail="Only PDF files are allowed")
 
-        # ✅ Save file locally
-        save_path = os.path.join(UPLOAD_DIR, f"user_{user.id}_{file.filename}")
-        with open(save_path, "wb") as buffer:
-            buffer.write(await file.read())
+        # ✅ Save file locally (streamed in chunks, off the event loop)
+        size, digest = await save_upload(file, temp_path)
 
-        # ✅ Save record in DB
-        lab = LabResult(user_id=user.id, filename=file.filename)
+        # ✅ Save record in DB, then keep the file as its content-addressed blob
+        lab = LabResult(user_id=current_user.id, filename=file.filename, file_digest=digest, file_size=size)
         db.add(lab)
-        db.commit()
-        db.refresh(lab)
+        await db.commit()
+        await place_lab_blob(db, lab, temp_path, digest)
+        lab_results_changed(current_user.id)
 
-        return {"message": "Lab result uploaded successfully", "filename": file.filename}
+        return {"message": "Lab result uploaded successfully", "filename": file.filename, "lab_result_id": lab.id}
 
-    except JWTError:
-        raise HTTPException(status_code=401, detail="Invalid token")
+    except HTTPException:
+        raise
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(status_code=500, detail=f"Error uploading file: {e}")
+    finally:
+        await discard(temp_path)
 
 # ===============================================
 # 🧠 USER FINAL INFO RETRIEVAL ENDPOINTS
@@ -297,31 +343,21 @@ from sqlalchemy import text
 
 # 🔹 1. Get user's dietary restriction(s)
 @app.get("/user/dietary_restrictions")
-def get_user_dietary_restrictions(db: Session = Depends(get_db), credentials: dict = Security(security), request: Request = None):
-    if not credentials:
-        raise HTTPException(status_code=401, detail="Missing token")
-
-    token = credentials.credentials
-    payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-    email = payload.get("sub")
-    user = db.query(User).filter(User.email == email).first()
-    if not user:
-        raise HTTPException(status_code=404, detail="User not found")
-
+def get_user_dietary_restrictions(db: Session = Depends(get_db), current_user: CurrentUser = Depends(get_current_user), request: Request = None):
     base_url = str(request.base_url).rstrip('/')
     results = db.execute(text("""
         SELECT d.id, d.name, d.logo_path
         FROM user_dietary_restrictions udr
         JOIN dietary_restrictions d ON udr.dietary_id = d.id
         WHERE udr.user_id = :uid
-    """), {"uid": user.id}).fetchall()
+    """), {"uid": current_user.id}).fetchall()
 
     return {
         "dietary_restrictions": [
             {
                 "id": r[0],
                 "name": r[1],
-                "logo_path": f"{base_url}/static/logos/{r[2]}" if r[2] else None
+                "logo_path": logo_url(base_url, r[2])
             }
             for r in results
         ]
@@ -332,33 +368,23 @@ def get_user_dietary_restrictions(db: Session = Depends(get_db), credentials: di
 @app.get("/user/allergies")
 def get_user_allergies(
     db: Session = Depends(get_db),
-    credentials: dict = Security(security),
+    current_user: CurrentUser = Depends(get_current_user),
     request: Request = None
 ):
-    if not credentials:
-        raise HTTPException(status_code=401, detail="Missing token")
-    token = credentials.credentials
-
-    payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-    email = payload.get("sub")
-    user = db.query(User).filter(User.email == email).first()
-    if not user:
-        raise HTTPException(status_code=404, detail="User not found")
-
     base_url = str(request.base_url).rstrip('/')
     results = db.execute(text("""
         SELECT a.id, a.name, a.logo_path
         FROM user_allergies ua
         JOIN allergies a ON ua.allergy_id = a.id
         WHERE ua.user_id = :uid
-    """), {"uid": user.id}).fetchall()
+    """), {"uid": current_user.id}).fetchall()
 
     return {
         "allergies": [
             {
                 "id": r[0],
                 "name": r[1],
-                "logo_path": f"{base_url}/static/logos/{r[2]}" if r[2] else None
+                "logo_path": logo_url(base_url, r[2])
             }
             for r in results
         ]
@@ -370,26 +396,16 @@ def get_user_allergies(
 @app.get("/user/servings")
 def get_user_serving(
     db: Session = Depends(get_db),
-    credentials: dict = Security(security),
+    current_user: CurrentUser = Depends(get_current_user),
     request: Request = None
 ):
-    if not credentials:
-        raise HTTPException(status_code=401, detail="Missing token")
-    token = credentials.credentials
-
-    payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-    email = payload.get("sub")
-    user = db.query(User).filter(User.email == email).first()
-    if not user:
-        raise HTTPException(status_code=404, detail="User not found")
-
     base_url = str(request.base_url).rstrip('/')
     result = db.execute(text("""
         SELECT s.id, s.name, s.logo_path, us.family_count
         FROM user_servings us
         JOIN servings s ON us.serving_id = s.id
         WHERE us.user_id = :uid
-    """), {"uid": user.id}).fetchone()
+    """), {"uid": current_user.id}).fetchone()
 
     if not result:
         return {"servings": []}
@@ -404,7 +420,7 @@ def get_user_serving(
         "servings": [{
             "id": sid,
             "name": name,
-            "logo_path": f"{base_url}/static/logos/{logo}" if logo else None
+            "logo_path": logo_url(base_url, logo)
         }]
     }
 
@@ -412,20 +428,10 @@ def get_user_serving(
 
 # 🔹 4. Get user's latest uploaded lab result
 @app.get("/user/lab_result")
-def get_user_lab_result(db: Session = Depends(get_db), credentials: dict = Security(security)):
-    if not credentials:
-        raise HTTPException(status_code=401, detail="Missing token")
-    token = credentials.credentials
-
-    payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-    email = payload.get("sub")
-    user = db.query(User).filter(User.email == email).first()
-    if not user:
-        raise HTTPException(status_code=404, detail="User not found")
-
+def get_user_lab_result(db: Session = Depends(get_db), current_user: CurrentUser = Depends(get_current_user)):
     result = (
         db.query(LabResult)
-        .filter(LabResult.user_id == user.id)
+        .filter(LabResult.user_id == current_user.id)
         .order_by(LabResult.uploaded_at.desc())
         .first()
     )
@@ -433,143 +439,56 @@ def get_user_lab_result(db: Session = Depends(get_db), credentials: dict = Secur
     if not result:
         return {"lab_result": None}
 
-    return {"lab_result": result.filename}
+    return {"lab_result": result.filename, "lab_result_id": result.id}
+
+
+# 📈 Biomarker time series: deltas, rolling averages and slope per marker
+@app.get("/user/lab_results/history")
+def get_user_lab_history(
+    request: Request,
+    limit: int = Query(50, ge=1, le=lab_history.LAB_HISTORY_MAX_POINTS),
+    window: int = Query(3, ge=1, le=12),
+    db: Session = Depends(get_db),
+    current_user: CurrentUser = Depends(get_current_user)
+):
+    entry = lab_history.get_history_entry(db, current_user.id, limit, window)
+    return lab_history.history_response(request, entry)
 
 from sqlalchemy import text
 
 @app.get("/user_info/{user_id}")
 def get_user_info(user_id: int, request: Request, db: Session = Depends(get_db)):
-    from sqlalchemy import text
-
-    user = db.query(User).filter(User.id == user_id).first()
-    if not user:
-        raise HTTPException(status_code=404, detail="User not found")
-
     base_url = str(request.base_url).rstrip('/')
 
-    # ✅ Fetch Dietary Restrictions (with ID)
-    diet_query = text("""
-        SELECT d.id, d.name, d.logo_path
-        FROM user_dietary_restrictions udr
-        JOIN dietary_restrictions d ON udr.dietary_id = d.id
-        WHERE udr.user_id = :user_id
-    """)
-    diets = [
-        {
-            "id": row[0],
-            "name": row[1],
-            "logo": f"{base_url}/static/logos/{row[2]}" if row[2] else None
-        }
-        for row in db.execute(diet_query, {"user_id": user_id}).fetchall()
-    ]
-
-    # ✅ Fetch Allergies (with ID)
-    allergy_query = text("""
-        SELECT a.id, a.name, a.logo_path
-        FROM user_allergies ua
-        JOIN allergies a ON ua.allergy_id = a.id
-        WHERE ua.user_id = :user_id
-    """)
-    allergies = [
-        {
-            "id": row[0],
-            "name": row[1],
-            "logo": f"{base_url}/static/logos/{row[2]}" if row[2] else None
-        }
-        for row in db.execute(allergy_query, {"user_id": user_id}).fetchall()
-    ]
-
-    # ✅ Fetch Serving Preference
-    serving_query = text("""
-        SELECT s.id, s.name, s.logo_path, us.family_count
-        FROM user_servings us
-        JOIN servings s ON us.serving_id = s.id
-        WHERE us.user_id = :user_id
-    """)
-
-    serving_result = db.execute(serving_query, {"user_id": user_id}).fetchone()
+    # ✅ One round trip on a miss, served from the per-user cache otherwise
+    entry = get_profile_entry(db, user_id, base_url)
+    if entry is None:
+        raise HTTPException(status_code=404, detail="User not found")
 
-    serving = None
-    if serving_result:
-        sid, name, logo, family_count = serving_result
+    return profile_response(request, entry)
 
-        # Adjust label for family
-        if "family" in name.lower() and family_count:
-            name = f"Family of {family_count}"
 
-        serving = {
-            "id": sid,
-            "name": name,
-            "logo": f"{base_url}/static/logos/{logo}" if logo else None,
-            "family_count": family_count
-        }
+# 📦 Many profiles at once for background jobs, streamed as NDJSON
+@app.post("/user_info/batch")
+def get_user_info_batch(payload: UserInfoBatchRequest, request: Request):
+    base_url = str(request.base_url).rstrip('/')
 
-    # # ✅ Fetch latest lab result (optional)
-    # lab_result = db.execute(
-    #     text("""
-    #         SELECT filename
-    #         FROM lab_results
-    #         WHERE user_id = :user_id
-    #         ORDER BY uploaded_at DESC
-    #         LIMIT 1
-    #     """),
-    #     {"user_id": user_id},
-    # ).fetchone()
-
-    # lab_result_filename = lab_result[0] if lab_result else None
-
-    lab_result = db.execute(
-        text("""
-            SELECT filename, glucose, ldl, hdl, triglycerides, creatinine
-            FROM lab_results
-            WHERE user_id = :user_id
-            ORDER BY uploaded_at DESC
-            LIMIT 1
-        """),
-        {"user_id": user_id},
-    ).fetchone()
-
-    lab_data = None
-    lab_status = None
-    if lab_result:
-
-        lab_data = {
-            "filename": lab_result[0],
-            "glucose": lab_result[1],
-            "ldl": lab_result[2],
-            "hdl": lab_result[3],
-            "triglycerides": lab_result[4],
-            "creatinine": lab_result[5],
-        }
+    # the generator outlives the request's get_db session, so it opens its own
+    def stream():
+        db = SessionLocal()
+        try:
+            for profile in iter_user_profiles(db, payload.user_ids, base_url):
+                yield json.dumps(profile, separators=(",", ":")) + "\n"
+        finally:
+            db.close()
 
-        lab_status = classify_lab_results({
-            "Glucose": lab_result[1],
-            "LDL": lab_result[2],
-            "HDL": lab_result[3],
-            "Triglycerides": lab_result[4],
-            "Creatinine": lab_result[5],
-        })
-
-    # ✅ Final response
-    # return {
-    #     "user_id": user_id,
-    #     "dietary_restrictions": diets,
-    #     "allergies": allergies,
-    #     "serving_preference": serving,   # 👈 ADD THIS
-    #     "lab_result_filename": lab_result_filename,
-    #     "lab_data": lab_data
-    # }
-    return {
-        "user_id": user_id,
-        "dietary_restrictions": diets,
-        "allergies": allergies,
-        "serving_preference": serving,
-        "lab_data": lab_data,
-        "lab_status": lab_status
-    }
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
 
 
 from sqlalchemy import text
+from fastapi import Query
+from models import UserDietaryRestriction, UserAllergies
+from crud import delete_user_selection
 
 # ===============================================
 # 🗑️ DELETE a specific dietary restriction for a user
@@ -578,24 +497,15 @@ from sqlalchemy import text
 def delete_user_dietary_restriction(
     dietary_id: int,
     db: Session = Depends(get_db),
-    credentials: dict = Security(security)
+    current_user: CurrentUser = Depends(get_current_user)
 ):
-    if not credentials:
-        raise HTTPException(status_code=401, detail="Missing token")
-
-    token = credentials.credentials
-    payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-    email = payload.get("sub")
-    user = db.query(User).filter(User.email == email).first()
-    if not user:
-        raise HTTPException(status_code=404, detail="User not found")
-
     try:
         result = db.execute(
             text("DELETE FROM user_dietary_restrictions WHERE user_id = :uid AND dietary_id = :did"),
-            {"uid": user.id, "did": dietary_id}
+            {"uid": current_user.id, "did": dietary_id}
         )
         db.commit()
+        profile_cache.invalidate(current_user.id)
 
         if result.rowcount == 0:
             raise HTTPException(status_code=404, detail="Dietary restriction not found for this user")
@@ -607,6 +517,25 @@ def delete_user_dietary_restriction(
         raise HTTPException(status_code=500, detail=f"Error deleting dietary restriction: {e}")
 
 
+# ===============================================
+# 🗑️ DELETE several dietary restrictions at once
+# ===============================================
+@app.delete("/user/dietary_restrictions")
+def delete_user_dietary_restrictions_batch(
+    dietary_ids: List[int] = Query(...),
+    db: Session = Depends(get_db),
+    current_user: CurrentUser = Depends(get_current_user)
+):
+    removed = delete_user_selection(db, UserDietaryRestriction, "dietary_id", current_user.id, dietary_ids)
+    if removed:
+        profile_cache.invalidate(current_user.id)
+    return {
+        "message": "Dietary restrictions deleted successfully",
+        "removed": removed,
+        "not_found": [i for i in dict.fromkeys(dietary_ids) if i not in removed]
+    }
+
+
 # ===============================================
 # 🗑️ DELETE a specific allergy for a user
 # ===============================================
@@ -614,24 +543,15 @@ def delete_user_dietary_restriction(
 def delete_user_allergy(
     allergy_id: int,
     db: Session = Depends(get_db),
-    credentials: dict = Security(security)
+    current_user: CurrentUser = Depends(get_current_user)
 ):
-    if not credentials:
-        raise HTTPException(status_code=401, detail="Missing token")
-
-    token = credentials.credentials
-    payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-    email = payload.get("sub")
-    user = db.query(User).filter(User.email == email).first()
-    if not user:
-        raise HTTPException(status_code=404, detail="User not found")
-
     try:
         result = db.execute(
             text("DELETE FROM user_allergies WHERE user_id = :uid AND allergy_id = :aid"),
-            {"uid": user.id, "aid": allergy_id}
+            {"uid": current_user.id, "aid": allergy_id}
         )
         db.commit()
+        profile_cache.invalidate(current_user.id)
 
         if result.rowcount == 0:
             raise HTTPException(status_code=404, detail="Allergy not found for this user")
@@ -643,121 +563,47 @@ def delete_user_allergy(
         raise HTTPException(status_code=500, detail=f"Error deleting allergy: {e}")
 
 
+# ===============================================
+# 🗑️ DELETE several allergies at once
+# ===============================================
+@app.delete("/user/allergies")
+def delete_user_allergies_batch(
+    allergy_ids: List[int] = Query(...),
+    db: Session = Depends(get_db),
+    current_user: CurrentUser = Depends(get_current_user)
+):
+    removed = delete_user_selection(db, UserAllergies, "allergy_id", current_user.id, allergy_ids)
+    if removed:
+        profile_cache.invalidate(current_user.id)
+    return {
+        "message": "Allergies deleted successfully",
+        "removed": removed,
+        "not_found": [i for i in dict.fromkeys(allergy_ids) if i not in removed]
+    }
+
+
 
 from fastapi import FastAPI, File, UploadFile, HTTPException, Depends
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse
-import fitz  # PyMuPDF
-import pytesseract
-from pdf2image import convert_from_path
-from PIL import Image
 import re, io, os, tempfile
+from lab_processing import classify_lab_results, EXTRACTOR_VERSION
+from crud import create_lab_result_async
+import lab_jobs
+import extraction_cache
 
 
-# 🧠 Utility function – Extract biomarkers
-def extract_lab_values(file_path: str):
-    text = ""
-
-    # If PDF
-    if file_path.lower().endswith(".pdf"):
-        doc = fitz.open(file_path)
-        for page in doc:
-            text += page.get_text("text") + "\n"
-
-        # If scanned (no text) → OCR
-        if len(text.strip()) < 50:
-            print("🟡 Scanned PDF detected — using OCR...")
-            images = convert_from_path(file_path)
-            for img in images:
-                text += pytesseract.image_to_string(img)
-        else:
-            print("🟢 Text-based PDF detected — no OCR needed.")
-
-    # If image
-    else:
-        print("🟡 Image detected — using OCR...")
-        img = Image.open(file_path)
-        text = pytesseract.image_to_string(img)
-
-    # Clean text
-    text = re.sub(r"\s+", " ", text)
-
-    print("\n================ EXTRACTED TEXT ================\n")
-    print(text)
-    print("\n===============================================\n")
-
-    # Regex patterns
-    patterns = {
-        "LDL": r"LDL[−\-]?C\s*(?:calculé)?\s*([\d.]+)",
-        "HDL": r"HDL[−\-]?C\s*([\d.]+)",
-        "Triglycerides": r"Triglyc[ée]rides\s*([\d.]+)",
-        "Glucose": r"(?:Glucose|Fasting Glucose)\s*([\d.]+)",
-        "Creatinine": r"Cr[ée]atinine\s*([\d.]+)"
-    }
+@app.on_event("startup")
+def start_lab_jobs():
+    # finished jobs write a LabResult row, so drop that user's cached profile
+    lab_jobs.start(on_done=lab_results_changed)
+
+
+@app.on_event("shutdown")
+def stop_lab_jobs():
+    lab_jobs.shutdown()
 
-    extracted = {}
-    for key, pattern in patterns.items():
-        match = re.search(pattern, text, re.IGNORECASE)
-        if match:
-            val = match.group(1)
-            if re.match(r"^\d+(\.\d+)?$", val):
-                extracted[key] = float(val)
-            else:
-                extracted[key] = val.capitalize()
-        else:
-            extracted[key] = None
-
-    return extracted
-
-def classify_lab_results(data):
-
-    result = {}
-
-    # LDL
-    ldl = data.get("LDL")
-    if ldl is not None:
-        if ldl < 100:
-            result["LDL_status"] = "Healthy"
-        else:
-            result["LDL_status"] = "High"
-
-    # HDL
-    hdl = data.get("HDL")
-    if hdl is not None:
-        if hdl < 40:
-            result["HDL_status"] = "Low"
-        elif hdl < 60:
-            result["HDL_status"] = "Healthy"
-        else:
-            result["HDL_status"] = "High"
-
-    # Triglycerides
-    trig = data.get("Triglycerides")
-    if trig is not None:
-        if trig < 150:
-            result["Triglycerides_status"] = "Healthy"
-        else:
-            result["Triglycerides_status"] = "High"
-
-    # Glucose
-    glucose = data.get("Glucose")
-    if glucose is not None:
-        if glucose < 100:
-            result["Glucose_status"] = "Healthy"
-        else:
-            result["Glucose_status"] = "High"
-
-    # Creatinine
-    creatinine = data.get("Creatinine")
-    if creatinine is not None:
-        if creatinine < 0.6:
-            result["Creatinine_status"] = "Low"
-        elif creatinine <= 1.3:
-            result["Creatinine_status"] = "Healthy"
-        else:
-            result["Creatinine_status"] = "High"
 
-    return result
 
 # ============================================
 # 📍 FastAPI Endpoint
@@ -842,100 +688,129 @@ def classify_lab_results(data):
 #         print("❌ Error:", e)
 #         raise HTTPException(status_code=500, detail=str(e))
 
-@app.post("/upload_lab_result_extract")
+@app.post("/upload_lab_result_extract", status_code=202)
 async def upload_lab_result_extract(
     file: UploadFile = File(...),
-    db: Session = Depends(get_db),
-    credentials: dict = Security(security)
+    db: AsyncSession = Depends(get_async_db),
+    current_user: CurrentUser = Depends(get_current_user)
 ):
+    job_id, job_path = lab_jobs.new_job_path(file.filename)
     try:
-        # ✅ Check token
-        if not credentials:
-            raise HTTPException(status_code=401, detail="Missing token")
-
-        token = credentials.credentials
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        email = payload.get("sub")
-
-        user = db.query(User).filter(User.email == email).first()
-
-        if not user:
-            raise HTTPException(status_code=404, detail="User not found")
-
-        # ✅ Save uploaded file temporarily
-        with tempfile.NamedTemporaryFile(
-            delete=False,
-            suffix=os.path.splitext(file.filename)[1]
-        ) as tmp:
-
-            tmp.write(await file.read())
-            tmp_path = tmp.name
-
-        # ✅ Extract biomarkers
-        extracted_data = extract_lab_values(tmp_path)
-
-        # ✅ Generate statuses
-        statuses = classify_lab_results(extracted_data)
-
-        print("EXTRACTED DATA:", extracted_data)
-        print("STATUSES:", statuses)
-
-        # ✅ Delete temp file
-        os.remove(tmp_path)
-
-        # ✅ Save to DB
-        lab = LabResult(
-            user_id=user.id,
-            filename=file.filename,
-            glucose=extracted_data.get("Glucose"),
-            ldl=extracted_data.get("LDL"),
-            hdl=extracted_data.get("HDL"),
-            triglycerides=extracted_data.get("Triglycerides"),
-            creatinine=extracted_data.get("Creatinine")
-        )
-
-        db.add(lab)
-        db.commit()
-        db.refresh(lab)
+        # ✅ Stream the upload to the job file, hashing as it goes
+        size, digest = await save_upload(file, job_path)
+
+        # ⚡ Same file seen before → reuse its extraction, no worker needed
+        extracted_data = await run_in_threadpool(extraction_cache.get, digest, EXTRACTOR_VERSION)
+        if extracted_data is not None:
+            statuses = classify_lab_results(extracted_data)
+            lab = await create_lab_result_async(
+                db, current_user.id, file.filename, extracted_data, file_digest=digest, file_size=size
+            )
+            await place_lab_blob(db, lab, job_path, digest)
+            lab_results_changed(current_user.id)
+            await run_in_threadpool(
+                lab_jobs.record_done, job_id, current_user.id, file.filename, digest,
+                {"data": extracted_data, "status": statuses}, lab.id
+            )
+            return JSONResponse(status_code=200, content={
+                "message": "Lab result processed successfully",
+                "job_id": job_id,
+                "state": lab_jobs.DONE,
+                "data": extracted_data,
+                "status": statuses
+            })
+
+        # ✅ Extraction + classification + DB save happen in the lab worker pool
+        # (the upload stays on disk until a worker has processed it)
+        await run_in_threadpool(lab_jobs.enqueue, job_id, current_user.id, file.filename, job_path, digest)
 
         return {
-            "message": "Lab result processed successfully",
-            "data": extracted_data,
-            "status": statuses
+            "message": "Lab result queued for processing",
+            "job_id": job_id,
+            "state": lab_jobs.QUEUED
         }
 
+    except HTTPException:
+        await discard(job_path)
+        raise
     except Exception as e:
-        db.rollback()
+        await db.rollback()
+        await discard(job_path)
         print("❌ Error:", e)
         raise HTTPException(status_code=500, detail=str(e))
-    
+
+
+# 🔎 Poll a lab extraction job
+@app.get("/lab_jobs/{job_id}")
+def get_lab_job(job_id: str, current_user: CurrentUser = Depends(get_current_user)):
+    job = lab_jobs.get_job(job_id)
+    if not job or job["user_id"] != current_user.id:
+        raise HTTPException(status_code=404, detail="Job not found")
+
+    result = job["result"] or {}
+    return {
+        "job_id": job_id,
+        "state": job["status"],
+        "data": result.get("data"),
+        "status": result.get("status"),
+        "lab_result_id": job["lab_result_id"],
+        "error": job["error"]
+    }
+
 @app.delete("/user/lab_result")
 def delete_lab_result(
     db: Session = Depends(get_db),
-    credentials: dict = Security(security)
+    current_user: CurrentUser = Depends(get_current_user)
 ):
-    if not credentials:
-        raise HTTPException(status_code=401, detail="Missing token")
-
-    token = credentials.credentials
-    payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-    email = payload.get("sub")
-
-    user = db.query(User).filter(User.email == email).first()
-
     lab = db.query(LabResult)\
-        .filter(LabResult.user_id == user.id)\
+        .filter(LabResult.user_id == current_user.id)\
         .order_by(LabResult.uploaded_at.desc())\
         .first()
 
     if not lab:
         raise HTTPException(status_code=404, detail="No lab result found")
 
+    digest = lab.file_digest
     db.delete(lab)
     db.commit()
+    lab_results_changed(current_user.id)
+
+    # 🗄️ free the file only if no other lab result points at the same blob
+    if digest:
+        lab_storage.release(db, digest)
 
     return {"message": "Lab result deleted"}
 
+
+# 📥 Download the uploaded file (Range requests, ETag / If-Modified-Since)
+@app.get("/user/lab_results/{lab_id}/file")
+def download_lab_result_file(
+    lab_id: int,
+    request: Request,
+    db: Session = Depends(get_db),
+    current_user: CurrentUser = Depends(get_current_user)
+):
+    lab = db.query(LabResult)\
+        .filter(LabResult.id == lab_id, LabResult.user_id == current_user.id)\
+        .first()
+
+    if not lab:
+        raise HTTPException(status_code=404, detail="No lab result found")
+
+    return lab_storage.file_response(request, lab)
+
+# ===============================================
+# 📊 LAB ANALYTICS (cohort dashboards)
+# ===============================================
+import lab_analytics
+from auth import require_internal_key
+
+# population health data: internal key only, never an app user's token
+@app.get("/analytics/lab_results", dependencies=[Depends(require_internal_key)])
+def get_lab_results_analytics(db: Session = Depends(get_db)):
+    # latest result per user; rebuilt at most every LAB_ANALYTICS_TTL_SECONDS
+    return lab_analytics.get_lab_analytics(db)
+
 from google.oauth2 import id_token
 from google.auth.transport import requests as google_requests
 
@@ -949,14 +824,6 @@ def google_login(data: dict, db: Session = Depends(get_db)):
 
     user = db.query(User).filter(User.email == email).first()
 
-    # 🔐 Create token function inline (same as login)
-    def generate_token(user_email):
-        token_data = {
-            "sub": user_email,
-            "exp": datetime.utcnow() + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
-        }
-        return jwt.encode(token_data, SECRET_KEY, algorithm=ALGORITHM)
-
     if not user:
         # 🔥 NEW USER
         user = User(
@@ -969,7 +836,7 @@ def google_login(data: dict, db: Session = Depends(get_db)):
         db.refresh(user)
 
         return {
-            "access_token": generate_token(user.email),
+            "access_token": create_access_token(user),
             "onboarding_completed": False,
             "user_id": user.id,
             "onboarding_step": user.onboarding_step
@@ -977,7 +844,7 @@ def google_login(data: dict, db: Session = Depends(get_db)):
 
     # 🔥 EXISTING USER
     return {
-        "access_token": generate_token(user.email),
+        "access_token": create_access_token(user),
         "onboarding_completed": user.onboarding_completed,
         "onboarding_step": user.onboarding_step,
         "user_id": user.id
@@ -989,36 +856,12 @@ def google_login(data: dict, db: Session = Depends(get_db)):
 def update_user_servings(
     selection: UserServingSelection,
     db: Session = Depends(get_db),
-    credentials: dict = Security(security)
+    current_user: CurrentUser = Depends(get_current_user)
 ):
-    if not credentials:
-        raise HTTPException(status_code=401, detail="Missing token")
-
-    token = credentials.credentials
-    payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-    email = payload.get("sub")
-
-    user = db.query(User).filter(User.email == email).first()
-    if not user:
-        raise HTTPException(status_code=404, detail="User not found")
-
-    family_count = selection.family_count
-
-    serving = db.query(Serving).filter(Serving.id == selection.serving_id).first()
-    if not serving:
-        raise HTTPException(status_code=404, detail="Invalid serving_id")
-
-    # 🔥 Handle default counts
-    if family_count is None:
-        if "just" in serving.name.lower():
-            family_count = 1
-        elif "couple" in serving.name.lower():
-            family_count = 2
-        elif "family" in serving.name.lower():
-            raise HTTPException(status_code=400, detail="Family count required")
+    family_count = resolve_family_count(db, selection)
 
     # 🔥 UPDATE existing row
-    existing = db.query(UserServing).filter(UserServing.user_id == user.id).first()
+    existing = db.query(UserServing).filter(UserServing.user_id == current_user.id).first()
 
     if not existing:
         raise HTTPException(status_code=404, detail="No existing serving to update")
@@ -1027,6 +870,7 @@ def update_user_servings(
     existing.family_count = family_count
 
     db.commit()
+    profile_cache.invalidate(current_user.id)
     db.refresh(existing)
 
     return {"message": "Serving updated successfully"}
@@ -1048,28 +892,133 @@ def save_recipe(
         carbs=recipe.carbs,
         fat=recipe.fat,
 
-        servings=recipe.servings
+        servings=recipe.servings,
+        ingredients_indexed=True
     )
 
     db.add(saved)
+    db.flush()
+    # 🔎 keep the ingredient index in the same transaction
+    ingredient_index.add_to_index(db, ingredient_index.index_rows(saved.id, saved.user_id, recipe.ingredients))
+    db.commit()
+
+    return {"message": "Recipe saved successfully", "recipe_id": saved.id}
+
+RECIPES_BULK_MAX = 100
+
+# 📦 Save many recipes at once (offline queue sync, a generated weekly plan):
+# validated together, one multi-row insert, one commit; ids come back in order
+@app.post("/api/recipes/save_bulk")
+def save_recipes_bulk(
+    recipes: List[SaveRecipeRequest],
+    db: Session = Depends(get_db)
+):
+    if not recipes:
+        raise HTTPException(status_code=400, detail="No recipes to save")
+    if len(recipes) > RECIPES_BULK_MAX:
+        raise HTTPException(status_code=400, detail=f"At most {RECIPES_BULK_MAX} recipes per request")
+
+    user_ids = {recipe.user_id for recipe in recipes}
+    found = db.query(User.id).filter(User.id.in_(user_ids)).count()
+    if found != len(user_ids):
+        raise HTTPException(status_code=404, detail="User not found")
+
+    now = datetime.utcnow()
+    ids = create_saved_recipes(db, [
+        {
+            "user_id": recipe.user_id,
+            "recipe_name": recipe.recipe_name,
+            "ingredients": json.dumps(recipe.ingredients),
+            "steps": json.dumps(recipe.steps),
+            "calories": recipe.calories,
+            "protein": recipe.protein,
+            "carbs": recipe.carbs,
+            "fat": recipe.fat,
+            "servings": recipe.servings,
+            "created_at": now,
+            "ingredients_indexed": True,
+        }
+        for recipe in recipes
+    ])
+
+    index_rows = []
+    for recipe_id, recipe in zip(ids, recipes):
+        index_rows += ingredient_index.index_rows(recipe_id, recipe.user_id, recipe.ingredients)
+    ingredient_index.add_to_index(db, index_rows)
     db.commit()
 
-    return {"message": "Recipe saved successfully"}
+    return {"message": f"{len(ids)} recipes saved successfully", "recipe_ids": ids}
+
+RECIPES_PAGE_SIZE = 20
+RECIPES_PAGE_MAX = 100
 
+# 📖 Newest first, one page at a time, summary fields only (full recipe via
+# /recipes/{recipe_id}). The body stays a plain list; the cursor for the next
+# page comes back in X-Next-Cursor (absent on the last page).
 @app.get("/recipes/user/{user_id}")
 def get_saved_recipes(
     user_id: int,
+    limit: int = Query(RECIPES_PAGE_SIZE, ge=1, le=RECIPES_PAGE_MAX),
+    cursor: Optional[str] = None,
     db: Session = Depends(get_db)
 ):
 
-    recipes = (
-        db.query(SavedRecipe)
-        .filter(SavedRecipe.user_id == user_id)
-        .order_by(SavedRecipe.created_at.desc())
-        .all()
-    )
+    after = decode_cursor(cursor) if cursor else None
+    rows = get_saved_recipes_page(db, user_id, limit, after)
+
+    headers = {}
+    if len(rows) > limit:
+        rows = rows[:limit]
+        headers["X-Next-Cursor"] = encode_cursor(rows[-1].created_at, rows[-1].id)
+
+    # plain dicts straight to JSON bytes, no ORM objects / jsonable_encoder
+    body = serialize([recipe_summary(row) for row in rows])
+    return Response(content=body, media_type="application/json", headers=headers)
+
+
+# recipes saved before the ingredient index existed
+@app.on_event("startup")
+def backfill_ingredient_index():
+    db = SessionLocal()
+    try:
+        indexed = ingredient_index.backfill(db)
+    finally:
+        db.close()
+    if indexed:
+        print(f"🔎 Indexed ingredients for {indexed} saved recipe(s)")
+
+
+# 🔎 Saved recipes by ingredient: ?include=chicken&include=rice&exclude=peanut
+# (comma-separated works too). Answered from saved_recipe_ingredients with
+# set intersections; returns summaries, newest first.
+@app.get("/recipes/user/{user_id}/search")
+def search_saved_recipes(
+    user_id: int,
+    include: List[str] = Query([]),
+    exclude: List[str] = Query([]),
+    limit: int = Query(RECIPES_PAGE_SIZE, ge=1, le=RECIPES_PAGE_MAX),
+    db: Session = Depends(get_db)
+):
+    ids = ingredient_index.search_recipe_ids(db, user_id, include, exclude)
+    rows = get_saved_recipe_summaries(db, sorted(ids), limit) if ids else []
 
-    return recipes
+    body = serialize({"count": len(ids), "recipes": [recipe_summary(row) for row in rows]})
+    return Response(content=body, media_type="application/json")
+
+
+# 🍲 Full recipe, with ingredients and steps decoded
+@app.get("/recipes/{recipe_id}")
+def get_recipe(recipe_id: int, db: Session = Depends(get_db)):
+    recipe = get_saved_recipe(db, recipe_id)
+    if not recipe:
+        raise HTTPException(status_code=404, detail="Recipe not found")
+
+    return {
+        **recipe_summary(recipe),
+        "user_id": recipe.user_id,
+        "ingredients": decode_recipe_list(recipe.ingredients),
+        "steps": decode_recipe_list(recipe.steps),
+    }
 
 
 from dotenv import load_dotenv
@@ -1086,7 +1035,6 @@ from pydantic import BaseModel
 import smtplib
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
-from crud import pwd_context
 import random
 
 class ForgotPasswordRequest(BaseModel):
@@ -1101,9 +1049,6 @@ class VerifyOtpRequest(BaseModel):
     email: str
     otp: str
 
-def hash_password(password: str):
-    return pwd_context.hash(password)
-
 def send_reset_email(receiver_email: str, otp: str):
 
     msg = MIMEMultipart()
@@ -1158,14 +1103,12 @@ def forgot_password(
     return {"message": "OTP sent successfully"}
 
 @app.post("/reset-password")
-def reset_password(
+async def reset_password(
     request: ResetPasswordRequest,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
 
-    user = db.query(User).filter(
-        User.email == request.email
-    ).first()
+    user = await get_user_by_email_async(db, request.email)
 
     if not user:
         raise HTTPException(404, "User not found")
@@ -1176,12 +1119,12 @@ def reset_password(
     if datetime.utcnow() > user.reset_otp_expiry:
         raise HTTPException(400, "OTP expired")
 
-    user.password = hash_password(request.new_password)
+    user.password = await hash_password_async(request.new_password)
 
     user.reset_otp = None
     user.reset_otp_expiry = None
 
-    db.commit()
+    await db.commit()
 
     return {
         "message": "Password updated successfully"
@@ -1207,3 +1150,20 @@ def verify_reset_otp(
 
     return {"message": "OTP verified"}
 
+
+# ===============================================
+# 📊 IN-PROCESS METRICS
+# ===============================================
+@app.get("/metrics")
+def get_metrics():
+    return {
+        "auth_token_cache": token_cache.stats(),
+        "password_hashing": hashing.stats(),
+        "catalog_cache": catalog_cache.stats(),
+        "profile_cache": profile_cache.stats(),
+        "lab_history": lab_history.stats(),
+        "lab_jobs": lab_jobs.stats(),
+        "lab_analytics": lab_analytics.stats(),
+        "lab_storage": lab_storage.stats(),
+        "lab_extraction_cache": extraction_cache.stats(),
+    }
@@ -7,7 +7,8 @@ from sqlalchemy import (
     DateTime,
     func,
     ForeignKey,
-    Boolean
+    Boolean,
+    Index
 )
 from datetime import datetime
 from sqlalchemy import Float  # 👈 ADD THIS IMPORT
@@ -37,6 +38,8 @@ class DietaryRestriction(Base):
     logo_path = Column(String(255))
 
 # diet - user join table
+# primary key (user_id, dietary_id) leads with user_id, so it also serves
+# the WHERE user_id = ? lookups — no separate index needed
 class UserDietaryRestriction(Base):
     __tablename__ = "user_dietary_restrictions"
 
@@ -51,6 +54,8 @@ class Allergy(Base):
     logo_path = Column(String(255))
 
 # allergy - user join table
+# primary key (user_id, allergy_id) leads with user_id, so it also serves
+# the WHERE user_id = ? lookups — no separate index needed
 class UserAllergies(Base):
     __tablename__ = "user_allergies"
 
@@ -65,6 +70,8 @@ class Serving(Base):
     name = Column(String(100), unique=True, nullable=False)
     logo_path = Column(String(255))
 
+# primary key (user_id, serving_id) leads with user_id, so it also serves
+# the WHERE user_id = ? lookups — no separate index needed
 class UserServing(Base):
     __tablename__ = "user_servings"
     user_id = Column(Integer, primary_key=True)
@@ -84,6 +91,14 @@ class LabResult(Base):
     hdl = Column(Float, nullable=True)
     triglycerides = Column(Float, nullable=True)
     creatinine = Column(Float, nullable=True)
+    # 🗄️ sha256 of the uploaded file = its blob in lab_storage (NULL for older rows)
+    file_digest = Column(String(64), nullable=True, index=True)
+    file_size = Column(Integer, nullable=True)
+    # 🧬 lab_jobs id that wrote this row, so a retried job can't insert a second one
+    job_id = Column(String(32), nullable=True, unique=True, index=True)
+
+    # latest result / history lookups: WHERE user_id = ? ORDER BY uploaded_at DESC
+    __table_args__ = (Index("ix_lab_results_user_uploaded", "user_id", "uploaded_at"),)
 
 class SavedRecipe(Base):
     __tablename__ = "saved_recipes"
@@ -104,3 +119,20 @@ class SavedRecipe(Base):
     servings = Column(Integer)
 
     created_at = Column(DateTime, default=datetime.utcnow)
+    # 🔎 ingredients tokenized into saved_recipe_ingredients (even if that gave no tokens)
+    ingredients_indexed = Column(Boolean, nullable=True)
+
+    # saved recipes list: WHERE user_id = ? ORDER BY created_at DESC
+    __table_args__ = (Index("ix_saved_recipes_user_created", "user_id", "created_at"),)
+
+# 🔎 Inverted index over SavedRecipe.ingredients: one row per canonical
+# ingredient token per recipe (see ingredient_index.py), so "recipes with
+# chicken, without peanuts" is a primary-key lookup instead of parsing blobs
+class SavedRecipeIngredient(Base):
+    __tablename__ = "saved_recipe_ingredients"
+
+    user_id = Column(Integer, primary_key=True)
+    token = Column(String(64), primary_key=True)
+    recipe_id = Column(Integer, ForeignKey("saved_recipes.id", ondelete="CASCADE"), primary_key=True)
+
+    __table_args__ = (Index("ix_saved_recipe_ingredients_recipe", "recipe_id"),)
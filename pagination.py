@@ -0,0 +1,21 @@
+import base64
+from datetime import datetime
+
+from fastapi import HTTPException
+
+# 🔖 Opaque keyset cursors: base64url("<created_at ISO>|<id>") of the last
+# row on a page. Clients pass it back as ?cursor= to get the next page.
+
+
+def encode_cursor(created_at: datetime, row_id: int):
+    raw = f"{created_at.isoformat()}|{row_id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        created_at, row_id = raw.rsplit("|", 1)
+        return datetime.fromisoformat(created_at), int(row_id)
+    except (ValueError, UnicodeDecodeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
@@ -0,0 +1,107 @@
+import os
+
+from fastapi import Request
+from sqlalchemy.orm import Session
+
+from biomarkers import BIOMARKERS
+from crud import get_user_profile_rows, get_user_profile_rows_batch
+from lab_processing import classify_lab_results
+from logo_assets import logo_url
+from response_cache import UserCache, serialize
+
+# /user_info profiles change rarely, so the serialized body is kept per user
+# (and base URL) until one of the user's diet/allergy/serving/lab writes
+# calls invalidate(user_id); the TTL also covers renamed catalog items.
+PROFILE_CACHE_MAX_ENTRIES = int(os.getenv("PROFILE_CACHE_MAX_ENTRIES", "5000"))
+PROFILE_CACHE_TTL_SECONDS = int(os.getenv("PROFILE_CACHE_TTL_SECONDS", "60"))
+# users per query for batch fetches; keeps the IN (...) lists a sane size
+PROFILE_BATCH_CHUNK_SIZE = int(os.getenv("PROFILE_BATCH_CHUNK_SIZE", "500"))
+
+_cache = UserCache(PROFILE_CACHE_MAX_ENTRIES, PROFILE_CACHE_TTL_SECONDS)  # (user_id, base_url) -> entry
+
+
+def build_user_profile(user_id: int, rows, base_url: str):
+    diets, allergies, servings, labs = [], [], [], []
+    for row in rows:
+        if row.kind == "diet":
+            diets.append(row)
+        elif row.kind == "allergy":
+            allergies.append(row)
+        elif row.kind == "serving":
+            servings.append(row)
+        elif row.kind == "lab":
+            labs.append(row)
+
+    serving = None
+    if servings:
+        row = servings[0]
+        name = row.name
+        # Adjust label for family
+        if "family" in name.lower() and row.family_count:
+            name = f"Family of {row.family_count}"
+        serving = {
+            "id": row.id,
+            "name": name,
+            "logo": logo_url(base_url, row.logo_path),
+            "family_count": row.family_count
+        }
+
+    lab_data = None
+    lab_status = None
+    if labs:
+        lab = labs[0]
+        lab_data = {"filename": lab.filename}
+        lab_data.update({m.column: getattr(lab, m.column) for m in BIOMARKERS})
+        lab_status = classify_lab_results({m.key: getattr(lab, m.column) for m in BIOMARKERS})
+
+    return {
+        "user_id": user_id,
+        "dietary_restrictions": [
+            {"id": r.id, "name": r.name, "logo": logo_url(base_url, r.logo_path)}
+            for r in sorted(diets, key=lambda r: r.id)
+        ],
+        "allergies": [
+            {"id": r.id, "name": r.name, "logo": logo_url(base_url, r.logo_path)}
+            for r in sorted(allergies, key=lambda r: r.id)
+        ],
+        "serving_preference": serving,
+        "lab_data": lab_data,
+        "lab_status": lab_status
+    }
+
+
+def iter_user_profiles(db: Session, user_ids: list[int], base_url: str):
+    # One query per chunk of users, grouped in memory; unknown ids are skipped.
+    # Bypasses the per-user cache so a nightly sweep doesn't flush it.
+    user_ids = list(dict.fromkeys(user_ids))
+    for i in range(0, len(user_ids), PROFILE_BATCH_CHUNK_SIZE):
+        chunk = user_ids[i:i + PROFILE_BATCH_CHUNK_SIZE]
+        grouped = {}
+        for row in get_user_profile_rows_batch(db, chunk):
+            grouped.setdefault(row.user_id, []).append(row)
+        for user_id in chunk:
+            rows = grouped.get(user_id)
+            if rows and any(row.kind == "user" for row in rows):
+                yield build_user_profile(user_id, rows, base_url)
+
+
+def invalidate(user_id: int):
+    _cache.invalidate(user_id)
+
+
+def get_profile_entry(db: Session, user_id: int, base_url: str):
+    def build():
+        rows = get_user_profile_rows(db, user_id)
+        if not any(row.kind == "user" for row in rows):
+            return None
+        return serialize(build_user_profile(user_id, rows, base_url))
+
+    return _cache.get((user_id, base_url), build)
+
+
+def profile_response(request: Request, entry):
+    return _cache.response(request, entry)
+
+
+def stats():
+    return _cache.stats()
@@ -0,0 +1,112 @@
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+
+from fastapi import Request, Response
+
+# 🗃️ Shared pieces of the in-memory JSON response caches:
+# ETag helpers + 304 handling (catalog_cache, lab_storage) and UserCache,
+# the per-user body cache behind /user_info and the lab history.
+
+
+def make_etag(body: bytes):
+    return '"' + hashlib.sha1(body).hexdigest()[:20] + '"'
+
+
+def serialize(payload):
+    return json.dumps(payload, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+
+
+def etag_matches(request: Request, etag: str):
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    # the gzip representation carries the same ETag with a -gzip suffix
+    candidates = [c.strip().removeprefix("W/").replace('-gzip"', '"') for c in header.split(",")]
+    return etag in candidates
+
+
+def not_modified(request: Request, etag: str, headers: dict):
+    # -> a 304 carrying the caching headers if the client's copy is current, else None
+    if etag_matches(request, etag):
+        return Response(status_code=304, headers=headers)
+    return None
+
+
+class UserCache:
+    # Serialized JSON bodies keyed by tuples that start with a user id, kept
+    # until invalidate(user_id), the TTL, or LRU eviction. invalidate() only
+    # reaches this process; the TTL bounds how stale another worker's copy
+    # can get. A body built while the user was invalidated isn't stored.
+    def __init__(self, max_entries: int, ttl_seconds: int):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> {"body", "etag", "built_at"}
+        self._readers = {}  # user_id -> builds in flight
+        self._stale_reads = set()  # users invalidated while one of those builds ran
+        self._stats = {"hits": 0, "misses": 0, "expired": 0, "not_modified": 0, "invalidations": 0}
+
+    def get(self, key: tuple, build):
+        # build() -> body bytes, or None when there is nothing to serve
+        user_id = key[0]
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and now - entry["built_at"] < self.ttl_seconds:
+                self._entries.move_to_end(key)
+                self._stats["hits"] += 1
+                return entry
+            if entry is not None:
+                del self._entries[key]
+                self._stats["expired"] += 1
+            self._stats["misses"] += 1
+            self._readers[user_id] = self._readers.get(user_id, 0) + 1
+
+        entry = None
+        try:
+            body = build()
+            if body is not None:
+                entry = {"body": body, "etag": make_etag(body), "built_at": now}
+        finally:
+            with self._lock:
+                stale = user_id in self._stale_reads
+                self._readers[user_id] -= 1
+                if not self._readers[user_id]:
+                    del self._readers[user_id]
+                    self._stale_reads.discard(user_id)
+                if entry is not None and not stale:
+                    self._entries[key] = entry
+                    while len(self._entries) > self.max_entries:
+                        self._entries.popitem(last=False)
+        return entry
+
+    def invalidate(self, user_id: int):
+        with self._lock:
+            if user_id in self._readers:
+                self._stale_reads.add(user_id)
+            self._stats["invalidations"] += 1
+            for key in [k for k in self._entries if k[0] == user_id]:
+                del self._entries[key]
+
+    def response(self, request: Request, entry):
+        headers = {"ETag": entry["etag"], "Cache-Control": "private, no-cache"}
+        response = not_modified(request, entry["etag"], headers)
+        if response is not None:
+            with self._lock:
+                self._stats["not_modified"] += 1
+            return response
+        return Response(content=entry["body"], media_type="application/json", headers=headers)
+
+    def stats(self):
+        with self._lock:
+            return {
+                **self._stats,
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl_seconds,
+            }
@@ -23,6 +23,7 @@ class DietaryRestrictionBase(BaseModel):
     id: int
     name: str
     logo_path: Optional[str] = None
+    logo_variants: Optional[dict] = None
 
     class Config:
         orm_mode = True
@@ -35,6 +36,7 @@ class AllergyBase(BaseModel):
     id: int
     name: str
     logo_path: str | None = None
+    logo_variants: dict | None = None
 
     class Config:
         orm_mode = True
@@ -45,6 +47,7 @@ class ServingBase(BaseModel):
     id: int
     name: str
     logo_path: str | None = None
+    logo_variants: dict | None = None
 
     class Config:
         orm_mode = True
@@ -67,4 +70,21 @@ class SaveRecipeRequest(BaseModel):
     carbs: float
     fat: float
 
-    servings: int
\ No newline at end of file
+    servings: int
+
+# 🔐 Identity resolved from a bearer token (see auth.get_current_user)
+class CurrentUser(BaseModel):
+    id: int
+    email: str
+    onboarding_completed: bool = False
+    onboarding_step: int = 1
+
+class UserInfoBatchRequest(BaseModel):
+    user_ids: List[int]
+
+# 🚀 Whole onboarding flow in one request
+class OnboardingSubmission(BaseModel):
+    dietary_ids: List[int] = []
+    allergy_ids: List[int] = []
+    serving: Optional[UserServingSelection] = None
+    complete: bool = True
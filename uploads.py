@@ -0,0 +1,97 @@
+import hashlib
+import os
+
+from fastapi import HTTPException, UploadFile
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse
+from starlette.datastructures import Headers
+
+# 📦 Streaming uploads
+# Uploads are copied to disk in fixed-size chunks and hashed along the way,
+# so a large scan is never held in memory as a whole. File writes run in
+# the threadpool, not on the event loop. FastAPI spools the whole multipart
+# body before a handler runs, so the size limit is enforced below that, by
+# UploadLimitMiddleware on the raw request body: 413 up front from
+# Content-Length when the client sends it, otherwise as soon as the running
+# total goes over. save_upload re-checks the file part itself.
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_MB", "25")) * 1024 * 1024
+UPLOAD_CHUNK_BYTES = int(os.getenv("UPLOAD_CHUNK_KB", "1024")) * 1024
+
+
+def _too_large():
+    return HTTPException(
+        status_code=413,
+        detail=f"File too large (max {MAX_UPLOAD_BYTES // (1024 * 1024)} MB)",
+    )
+
+
+class UploadLimitMiddleware:
+    def __init__(self, app, paths, max_bytes: int = MAX_UPLOAD_BYTES):
+        self.app = app
+        self.paths = set(paths)
+        # multipart overhead is small, so the whole body is a good upper bound
+        self.max_body_bytes = max_bytes + 64 * 1024
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] != "POST" or scope["path"] not in self.paths:
+            await self.app(scope, receive, send)
+            return
+
+        length = Headers(scope=scope).get("content-length")
+        if length and length.isdigit() and int(length) > self.max_body_bytes:
+            # answered before any of the body is read
+            response = JSONResponse({"detail": _too_large().detail}, status_code=413)
+            await response(scope, receive, send)
+            return
+
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_body_bytes:
+                    # raised while FastAPI parses the form, which passes HTTPException through
+                    raise _too_large()
+            return message
+
+        await self.app(scope, limited_receive, send)
+
+
+def _remove(path: str):
+    if os.path.exists(path):
+        os.remove(path)
+
+
+async def save_upload(file: UploadFile, dest_path: str, max_bytes: int = MAX_UPLOAD_BYTES):
+    # -> (size in bytes, sha256 hex digest)
+    # written to "<dest>.part" and renamed at the end, so a half-written
+    # file never shows up under its final name
+    part_path = dest_path + ".part"
+    digest = hashlib.sha256()
+    size = 0
+    out = await run_in_threadpool(open, part_path, "wb")
+    try:
+        while True:
+            chunk = await file.read(UPLOAD_CHUNK_BYTES)
+            if not chunk:
+                break
+            size += len(chunk)
+            if size > max_bytes:
+                raise _too_large()
+            digest.update(chunk)
+            await run_in_threadpool(out.write, chunk)
+        await run_in_threadpool(out.close)
+        await run_in_threadpool(os.replace, part_path, dest_path)
+    except BaseException:
+        await run_in_threadpool(out.close)
+        await run_in_threadpool(_remove, part_path)
+        raise
+    finally:
+        await file.close()
+    return size, digest.hexdigest()
+
+
+async def discard(path: str):
+    await run_in_threadpool(_remove, path)